@@ -1,4 +1,7 @@
+import time
+start_time = time.perf_counter()
+
 import resources.App as App
 
-app = App.App()
+app = App.App(start_time)
 app.mainloop()
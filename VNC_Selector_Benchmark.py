@@ -0,0 +1,4 @@
+import sys
+import resources.Benchmark as Benchmark
+
+sys.exit(Benchmark.main())
@@ -0,0 +1,4 @@
+import sys
+import resources.Cli as Cli
+
+sys.exit(Cli.main())
@@ -1,21 +1,41 @@
 import tkinter as tk
+from tkinter import messagebox, filedialog
 import resources.Toplevels as Toplevels
 import resources.SelectorTools as SelectorTools
-from PIL import ImageTk
+import resources.Resolvers as Resolvers
+import resources.Inventory as Inventory
+import resources.Metrics as Metrics
+import resources.Tracing as Tracing
 import threading
+from concurrent.futures import ThreadPoolExecutor
+import socket
+import sqlite3
 import time
+import os
+import sys
 
+STATUS_REFRESHES = Metrics.Counter('vnc_selector_status_refreshes_total', 'Connection status refreshes finished, by trigger (manual or scheduled).')
+STATUS_REFRESH_SECONDS = Metrics.Histogram('vnc_selector_status_refresh_seconds', 'Time taken by each status refresh, by trigger (manual or scheduled).')
+SYNC_FAILURES = Metrics.Counter('vnc_selector_sync_failures_total', 'Checks for connections changed by other instances which failed, e.g. because the data file was locked.')
+CONNECTIONS = Metrics.Gauge('vnc_selector_connections', 'Known connections after the last status refresh, by whether they were alive.')
+_INVENTORY_FILETYPES = [('CSV', '*.csv'), ('JSON', '*.json'), ('Newline-delimited JSON', '*.ndjson *.jsonl'), ('All files', '*.*')]
 
 class App(tk.Tk):
     '''
     Main VNC Selector application.
     '''
-    # Class Variables.
-    hostname, ip = SelectorTools.get_this_pc_info().values()
-
-    def __init__(self):
+    def __init__(self, start_time:float=None):
+        '''
+        args:
+          start_time (float):  time.perf_counter() value when the program started, used to measure the
+                               startup time. (default the time App is created)
+        '''
+        self._start_time = start_time or time.perf_counter()
+        Tracing.configure_from_environment()
+        Metrics.configure_from_environment()
+        self.startup_time = None  # Seconds from start_time to the first paint of the main window.
         tk.Tk.__init__(self)
-        self.title(f'VNC Selector on [{App.hostname}]')
+        self.title(f'VNC Selector on [{socket.gethostname()}]')
         x = int(self.winfo_screenwidth()/2.5) - 10
         y = int(self.winfo_screenheight()/2.5) - 10
         self.geometry(f'360x160+{x}+{y}')
@@ -28,28 +48,37 @@ class App(tk.Tk):
             'Edit Connection': 1,
             'Delete Connection': 2,
             'Scan Network': 3,
-            'Settings': 5,
-            'Exit': 7
+            'Import Connections': 4,
+            'Export Connections': 5,
+            'Settings': 7,
+            'Exit': 9
         }
-        self._refresh_image = ImageTk.PhotoImage(file='resources\\refresh.png')
-        self._green_led = ImageTk.PhotoImage(file='resources\\green.png')
-        self._red_led = ImageTk.PhotoImage(file='resources\\red.png')
-        self._grey_led = ImageTk.PhotoImage(file='resources\\grey.png')
         self._status_led = None  # Assigned to tk.Canvas in create_widgets().
+        self._status_led_image = None  # Canvas image item id, assigned in create_widgets().
         self._connect_button = None  # Assigned to tk.Button in create_widgets().
         self._refresh_button = None  # Assigned to tk.Button in create_widgets().
-        self._listbox = None  # Assied to tk.Listbox in create_widgets().
-        self._listbox_list = tk.StringVar()
+        self._listbox = None  # Assigned to Toplevels.VirtualListbox in create_widgets().
         self.target = {
             'connection': tk.StringVar(),
             'hostname': tk.StringVar(),
             'ip address': tk.StringVar()
             }
         self.available_connections = self.get_saved_connections()
+        self.available_connections.subscribe(self._on_connections_changed)
         self.settings = self.get_saved_settings()
+        self._status_scheduler = SelectorTools.StatusScheduler()
+        self._selection_probes = ThreadPoolExecutor(max_workers=1, thread_name_prefix='selection-probe')
+        self._viewer_launcher = SelectorTools.ViewerLauncher()
+        for name in self.available_connections:
+            self._status_scheduler.add(name)
+        Resolvers.host_resolver.prefetch([conn['hostname'] for conn in self.available_connections.values()])
 
         # Start the app.
+        self._ui_queue = Toplevels.MainThreadQueue(self)
         self._create_widgets()
+        self.bind('<Map>', self._on_first_map)
+        self.after(int(SelectorTools.SYNC_INTERVAL * 1000), self._sync_connections)
+        threading.Thread(target=SelectorTools.get_this_pc_info, daemon=True).start()
         self.run_status_thread(True)
 
     def _create_widgets(self):
@@ -63,6 +92,8 @@ class App(tk.Tk):
         self._file_menu.add_command(label='Edit Connection', command=self.edit_connection)
         self._file_menu.add_command(label='Delete Connection', command=self.delete_connection)
         self._file_menu.add_command(label='Scan Network', command=self.scan_network)
+        self._file_menu.add_command(label='Import Connections...', command=self.import_connections)
+        self._file_menu.add_command(label='Export Connections...', command=self.export_connections)
         self._file_menu.add_separator()
         self._file_menu.add_command(label='Settings', command=self.show_settings)
         self._file_menu.add_separator()
@@ -88,23 +119,21 @@ class App(tk.Tk):
 
         # Build and pack the list frame widgets.
         tk.Label(list_frame, text='Select a connection:').pack(anchor=tk.NW)
-        self._listbox = tk.Listbox(list_frame, listvariable=self._listbox_list)
+        self._listbox = Toplevels.VirtualListbox(list_frame)
         self._listbox.pack(fill=tk.BOTH, side=tk.LEFT, expand=True, padx=2, pady=2)
-        self._listbox.bind('<<ListboxSelect>>', self.update_info)
-        scrollbar = tk.Scrollbar(list_frame)
-        scrollbar.pack(side=tk.LEFT, fill=tk.Y)
+        self._listbox.bind('<<ListboxSelect>>', self._on_select)
 
         # Build and pack the info frame widgets.
         tk.Label(info_frame_subframe, text='Connection').pack(fill=tk.X, side=tk.LEFT, padx=(55, 0))
         self._status_led = tk.Canvas(info_frame_subframe, width=19, height=19)
         self._status_led.pack(side=tk.RIGHT)
-        self._status_led.create_image(11, 11, image=self._red_led)
+        self._status_led_image = self._status_led.create_image(11, 11, image=Toplevels.load_image('red'))
         tk.Label(info_frame, textvariable=self.target['connection'], borderwidth=2, relief='sunken').pack(fill=tk.X, expand=True)
         tk.Label(info_frame, text='Target Hostname').pack(fill=tk.X)
         tk.Label(info_frame, textvariable=self.target['hostname'], borderwidth=2, relief='sunken').pack(fill=tk.X, expand=True)
         tk.Label(info_frame, text='Target IP').pack(fill=tk.X)
         tk.Label(info_frame, textvariable=self.target['ip address'], borderwidth=2, relief='sunken').pack(fill=tk.X, expand=True)
-        self._refresh_button = tk.Button(button_frame, image=self._refresh_image, compound=tk.LEFT, command=lambda : self.run_status_thread())
+        self._refresh_button = tk.Button(button_frame, image=Toplevels.load_image('refresh'), compound=tk.LEFT, command=lambda : self.run_status_thread())
         self._refresh_button.pack(side=tk.LEFT)
         Toplevels.Tooltip(self._refresh_button, 'Refresh all servers status')
         self._connect_button = tk.Button(button_frame, text='Connect', command=self.connect)
@@ -112,9 +141,7 @@ class App(tk.Tk):
 
         # Widget config settings.
         self.config(menu=menu)
-        self._listbox_list.set(sorted([key for key in self.available_connections.keys()]))
-        scrollbar.config(command=self._listbox.yview)
-        self._listbox.config(yscrollcommand=scrollbar.set)
+        self._listbox.set_items(self.available_connections.keys())
         self._connect_button.config(state='disabled')
         self.update_widget_visibility()
     
@@ -128,9 +155,68 @@ class App(tk.Tk):
         else:
             self._refresh_button.config(state='disabled')
             self._status_led.config(state='disabled')
-            self._status_led.create_image(11, 11, image=self._grey_led)
+            self._set_status_led('grey')
             self._connect_button.config(state='normal')
 
+    def _set_status_led(self, color:str):
+        '''
+        Shows the 'green', 'red' or 'grey' LED image in the status LED, reusing its canvas item.
+        '''
+        self._status_led.itemconfig(self._status_led_image, image=Toplevels.load_image(color))
+
+    def _on_first_map(self, event):
+        '''
+        Records the startup time once the main window is first shown. If the VNC_SELECTOR_STARTUP_TIME
+        environment variable is set, the time is shown in the title bar, and written to stderr when there
+        is one (there isn't under pythonw, which runs VNC_Selector.pyw).
+        '''
+        if event.widget is not self or self.startup_time is not None:
+            return
+        self.update_idletasks()
+        self.startup_time = time.perf_counter() - self._start_time
+        if os.environ.get('VNC_SELECTOR_STARTUP_TIME'):
+            message = f'startup time: {self.startup_time * 1000:.1f} ms'
+            self.title(f'{self.title()} ({message})')
+            if sys.stderr is not None:
+                sys.stderr.write(f'VNC Selector {message}\n')
+
+    def _on_select(self, event=None):
+        '''
+        Listbox <<ListboxSelect>> handler. Updates the connection info, then probes the selected connection
+        straight away unless its status is younger than the 'status freshness' setting (seconds).
+        '''
+        self.update_info()
+        name = self._listbox.selection()
+        if name is not None and self.settings['enable scan']:
+            age = self._status_scheduler.age(name)
+            if age is None or age > self.settings['status freshness']:
+                self._selection_probes.submit(self._probe_selected, name)
+
+    def _probe_selected(self, name:str):
+        '''
+        Background task. Probes a connection which has been selected, on its own thread so it doesn't wait
+        behind a running status refresh. Skipped if the selection has moved on, or another probe has since
+        refreshed its status.
+        '''
+        if name != self._listbox.selection():
+            return
+        age = self._status_scheduler.age(name)
+        if age is not None and age <= self.settings['status freshness']:
+            return
+        connection = self.available_connections.get(name)
+        if connection is None:
+            return
+        address = connection['hostname'] if connection['hostname'] != '' else connection['ip address']
+        try:
+            port = SelectorTools.parse_port(connection['vnc port'])
+        except ValueError:
+            self._set_status(name, False)
+            return
+        with Tracing.span('selection probe', 'status', name=name):
+            alive = SelectorTools.is_alive(address, port, self.settings['rfb handshake'])
+        self._set_status(name, alive)
+
+    @Tracing.traced('update info', 'ui')
     def update_info(self, event=None):
         '''
         Usually called upon listbox <<ListboxSelect>> event. Updates all of the information displayed for 'Connection', 'Hostname', 'IP Address', and
@@ -141,12 +227,12 @@ class App(tk.Tk):
         '''
         tk.Event
         try:
-            selected_target = self._listbox.get(self._listbox.curselection())
+            selected_target = self._listbox.selection()
             is_alive = self.available_connections[selected_target]['is alive']
             self.target['connection'].set(selected_target)
             self.target['hostname'].set(self.available_connections[selected_target]['hostname'])
             self.target['ip address'].set(self.available_connections[selected_target]['ip address'])
-            self._status_led.create_image(11, 11, image=self._green_led if is_alive else self._red_led)
+            self._set_status_led('green' if is_alive else 'red')
             self._connect_button.config(state='normal' if is_alive else 'disabled')
             self._file_menu.entryconfig(self._file_menu_index['Edit Connection'], state='normal')
             self._file_menu.entryconfig(self._file_menu_index['Delete Connection'], state='normal')
@@ -154,7 +240,7 @@ class App(tk.Tk):
             self.target['connection'].set('')
             self.target['hostname'].set('')
             self.target['ip address'].set('')
-            self._status_led.create_image(11, 11, image=self._red_led)
+            self._set_status_led('red')
             self._connect_button.config(state='disabled')
             self._file_menu.entryconfig(self._file_menu_index['Edit Connection'], state='disabled')
             self._file_menu.entryconfig(self._file_menu_index['Delete Connection'], state='disabled')
@@ -162,56 +248,174 @@ class App(tk.Tk):
         
     def connect(self):
         '''
-        Method which calls SelectorTools.launch_viewer, passing it the info for the currently
-        selected connection.
+        Launches the viewer for the currently selected connection through the viewer launcher, without
+        waiting for it to start. See _on_launched().
         '''
         # the server password should be accessed here.
-        connection = self.target['connection'].get()
-        hostname = self.available_connections[connection]['hostname']
-        ip = self.available_connections[connection]['ip address']
-        pwd = self.available_connections[connection]['vnc password']
-        port = self.available_connections[connection]['vnc port']
-        target = hostname if hostname != '' else ip
-        SelectorTools.launch_viewer(target, pwd, port)
-        if self.settings['enable close']:
+        name = self.target['connection'].get()
+        future = self._viewer_launcher.launch(name, self.available_connections[name])
+        future.add_done_callback(lambda future: self._ui_queue.post(('launched', name), lambda: self._on_launched(future.result())))
+
+    def _on_launched(self, result:dict):
+        '''
+        Called on the main thread when a viewer launch completes. Shows an error if the viewer didn't start,
+        otherwise closes the app if the 'enable close' setting is on.
+
+        args:
+          result (dict):  The SelectorTools.ViewerLauncher.launch() result.
+        '''
+        if not result['launched']:
+            messagebox.showerror('Connect Error', f"Couldn't start the viewer for {result['name']}. {result['error']}")
+        elif self.settings['enable close']:
             self.destroy()
     
     def get_saved_connections(self):
         '''
-        Returns connection dict loaded from the data file.
+        Returns the shared connection store, loaded from the data file on first use.
         '''
-        return SelectorTools.get_connections_from_file()
+        return SelectorTools.get_connection_store()
+
+    @Tracing.traced('connections changed', 'ui')
+    def _on_connections_changed(self, event, name, old_name):
+        '''
+        Connection store subscriber. Applies each added, edited or deleted connection to the listbox,
+        and schedules added and edited connections to be checked straight away. After a bulk change the
+        listbox is reloaded, and only connections which are new to the status scheduler are checked.
+        '''
+        if event == 'load':
+            names = list(self.available_connections)
+            self._ui_queue.post('load connections', lambda : self._listbox.set_items(names))
+            for name in self._status_scheduler:
+                if name not in self.available_connections:
+                    self._status_scheduler.remove(name)
+            for name in names:
+                if name not in self._status_scheduler:
+                    self._status_scheduler.add(name)
+            return
+        if event == 'insert':
+            self._listbox.insert(name)
+        elif event == 'delete':
+            self._listbox.remove(name)
+        elif event == 'update' and name != old_name:
+            self._listbox.rename(old_name, name)
+        self._status_scheduler.remove(old_name)
+        if event != 'delete':
+            self._status_scheduler.add(name)
     
+    def _sync_connections(self):
+        '''
+        Merges connections added, edited or deleted by other instances sharing the data file, then checks
+        again after SelectorTools.SYNC_INTERVAL seconds. Runs on the main thread, so the store's
+        subscribers update the listbox directly, and waits at most SelectorTools.SYNC_TIMEOUT seconds for
+        a locked data file.
+        '''
+        try:
+            if self.available_connections.sync(timeout=SelectorTools.SYNC_TIMEOUT):
+                self.update_info()
+        except sqlite3.Error:
+            # A locked or unreachable data file is retried on the next check.
+            SYNC_FAILURES.inc()
+        finally:
+            self.after(int(SelectorTools.SYNC_INTERVAL * 1000), self._sync_connections)
+
+    def _check_connections(self, connections):
+        '''
+        Probes the provided connections concurrently (up to the 'status workers' setting at once), updating
+        each one's 'is alive' status and reporting it to the status scheduler as its probe completes.
+        Widget updates are posted to the main thread through the UI queue. If the checks fail part way
+        through, the connections without a result are reported as down, so they are still rescheduled.
+
+        args:
+          connections (list):  (name, connection dict) pairs to probe.
+        '''
+        connections = list(connections)
+        pending = set(name for name, connection in connections)
+        try:
+            for key, alive in SelectorTools.check_status(connections, self.settings['status workers'], self.settings['rfb handshake']):
+                pending.discard(key)
+                self._set_status(key, alive)
+        except Exception:
+            for key in pending:
+                self._set_status(key, False)
+
+    def _record_status_metrics(self, trigger:str, started:float):
+        '''
+        Updates the status refresh metrics after a manual or scheduled check which started at the
+        provided time.perf_counter() value.
+        '''
+        if not Metrics.enabled:
+            return
+        connections = self.available_connections.values()
+        STATUS_REFRESHES.inc(trigger=trigger)
+        STATUS_REFRESH_SECONDS.observe(time.perf_counter() - started, trigger=trigger)
+        alive_count = sum(1 for connection in connections if connection['is alive'])
+        CONNECTIONS.set(alive_count, alive='true')
+        CONNECTIONS.set(len(connections) - alive_count, alive='false')
+
+    def _set_status(self, key:str, alive:bool):
+        '''
+        Records a probe result: updates the connection's 'is alive' status, reports it to the status
+        scheduler, and refreshes the info panel if the connection is selected.
+        '''
+        try:
+            self.available_connections[key]['is alive'] = alive
+        except KeyError as e:
+            # KeyErrors may occur while the user edits a connection.
+            return
+        self._status_scheduler.report(key, alive)
+        if key == self._listbox.selection():
+            self._ui_queue.post('update info', self.update_info)
+
+    def _run_status_scheduler(self):
+        '''
+        Checks each connection whenever the status scheduler says it is due, until the app closes. Checks
+        pause while the 'enable scan' setting is off, until the scheduler is woken (show_settings() requests
+        every connection when the settings change).
+        '''
+        scheduler = self._status_scheduler
+        while True:
+            if not self.settings['enable scan']:
+                scheduler.wait(due=False)
+                continue
+            names = scheduler.pop_due()
+            if not names:
+                scheduler.wait()
+                continue
+            started = time.perf_counter()
+            connections = [(name, connection) for name, connection in ((name, self.available_connections.get(name)) for name in names)
+                           if connection is not None]
+            with Tracing.span('scheduled status check', 'status', connections=len(connections)):
+                self._check_connections(connections)
+            self._record_status_metrics('scheduled', started)
+
     def update_connection_status(self, loop=False):
         '''
         WARNING: Auto-refresh (loop=True) is enabled and started during App init, and should not typically
         be started manually.
         
-        Background task, and called when 'refresh' button is pressed. Updates the 'is alive' status of 
-        each connection listed, then calls update_info().
+        Background task, and called when 'refresh' button is pressed. Probes every connection listed
+        concurrently, updating its 'is alive' status as each probe completes.
 
-        Auto-refresh rate is 60 seconds. 
+        Auto-refresh checks each connection when it is due, according to the status scheduler (see
+        SelectorTools.StatusScheduler): less and less often while it stays up or down, often for an hour
+        after it changes, and again after a few seconds when it changes. It runs until the app closes.
 
         args:
-          loop (bool):  If True, auto-refresh is enabled. (default False)
+          loop (bool):  If True, run auto-refresh. (default False)
         '''
+        if loop:
+            self._run_status_scheduler()
+            return
         if self.settings['enable scan']:
-            for key in self.available_connections.keys():
-                try:
-                    if self.available_connections[key]['hostname'] != '':
-                        self.available_connections[key]['is alive'] = SelectorTools.is_alive(self.available_connections[key]['hostname'])
-                    else:
-                        self.available_connections[key]['is alive'] = SelectorTools.is_alive(self.available_connections[key]['ip address'])
-                except KeyError as e:
-                    # KeyErrors may occur in a loop which was running while the user edits a connection.
-                    break
-            self.update_info()
-            if loop:
-                time.sleep(60)
-                if self.settings['enable scan']:
-                    self.update_connection_status(True)
-            else:
-                self._refresh_button.config(state='normal')
+            trace_start = Tracing.now()
+            started = time.perf_counter()
+            connections = self.available_connections
+            self._check_connections(connections.items())
+            self._ui_queue.post('update info', self.update_info)
+            self._record_status_metrics('manual', started)
+            if Tracing.enabled:
+                Tracing.complete('status refresh', 'status', trace_start, {'connections': len(connections)})
+            self._ui_queue.post('refresh button', lambda : self._refresh_button.config(state='normal'))
 
     def run_status_thread(self, loop=False):
         '''
@@ -228,59 +432,91 @@ class App(tk.Tk):
 
     def add_connection(self):
         '''
-        Loads the Add Connection window, then updates all available connections and their status.
+        Loads the Add Connection window, then updates the connection info. The status scheduler checks the new connection.
         '''
         Toplevels.AddConnection(self).wait_window()
-        self.available_connections = self.get_saved_connections()
-        self._listbox_list.set(sorted([key for key in self.available_connections.keys()]))
-        self._listbox.select_clear(0, tk.END)
         self.update_info()
-        self.run_status_thread()
 
     def edit_connection(self):
         '''
-        Loads the Edit Connection window, then updates all available connections and their status.
+        Loads the Edit Connection window, then updates the connection info. The status scheduler checks the edited connection.
         '''
-        connection = self._listbox.get(self._listbox.curselection()[0])
+        connection = self._listbox.selection()
         Toplevels.EditConnection(self, connection).wait_window()
-        self.available_connections = self.get_saved_connections()
-        self._listbox_list.set(sorted([key for key in self.available_connections.keys()]))
-        self._listbox.select_clear(0, tk.END)
         self.update_info()
-        self.run_status_thread()
 
     def delete_connection(self):
         '''
-        Loads the Delete Connection window, then updates all available connections and their status.
+        Loads the Delete Connection window, then updates the connection info.
         '''
-        connection = self._listbox.get(self._listbox.curselection()[0])
+        connection = self._listbox.selection()
         self.bell()
         Toplevels.DeleteConnection(connection)
-        self.available_connections = self.get_saved_connections()
-        self._listbox_list.set(sorted([key for key in self.available_connections.keys()]))
-        self._listbox.select_clear(0, tk.END)
         self.update_info()
-        self.run_status_thread()
 
     def scan_network(self):
         '''
-        Loads the Scan Network window, then updates all available connections and their status.
+        Loads the Scan Network window, then updates the connection info. The status scheduler checks any added connections.
         '''
         Toplevels.ScanNetwork(self).wait_window()
-        self.available_connections = self.get_saved_connections()
-        self._listbox_list.set(sorted([key for key in self.available_connections.keys()]))
-        self._listbox.select_clear(0, tk.END)
         self.update_info()
-        self.run_status_thread()
+
+    def import_connections(self):
+        '''
+        Asks for a CSV, JSON or newline-delimited JSON file, adds its connections, and shows how many were
+        imported and skipped. The status scheduler checks the imported connections.
+        '''
+        file = filedialog.askopenfilename(parent=self, title='Import Connections', filetypes=_INVENTORY_FILETYPES)
+        if not file:
+            return
+        skipped = []
+
+        def on_skip(number, record, reason):
+            if len(skipped) < 10:
+                skipped.append(f'Record {number}: {reason}')
+        try:
+            with open(file, newline='', encoding='utf-8-sig') as f:
+                summary = Inventory.import_connections(self.available_connections, f, Inventory.detect_format(file), on_skip)
+        except (OSError, ValueError, KeyError) as e:
+            messagebox.showerror('Import Error', f"Couldn't import {os.path.basename(file)}. {e}", parent=self)
+            return
+        message = f"Imported {summary['imported']} of {summary['read']} connections."
+        if summary['skipped']:
+            message += f"\n\nSkipped {summary['skipped']}:\n" + '\n'.join(skipped)
+            if summary['skipped'] > len(skipped):
+                message += '\n...'
+        messagebox.showinfo('Import Connections', message, parent=self)
+        self.update_info()
+
+    def export_connections(self):
+        '''
+        Asks for a file name, and writes every connection to it as CSV, JSON or newline-delimited JSON,
+        according to its extension. Passwords are not exported.
+        '''
+        file = filedialog.asksaveasfilename(parent=self, title='Export Connections', defaultextension='.csv',
+                                            filetypes=_INVENTORY_FILETYPES)
+        if not file:
+            return
+        temp = f'{file}.tmp'
+        try:
+            format = Inventory.detect_format(file)
+            with open(temp, 'w', newline='', encoding='utf-8') as f:
+                count = Inventory.export_connections(self.available_connections, f, format)
+            os.replace(temp, file)
+        except (OSError, ValueError) as e:
+            messagebox.showerror('Export Error', f"Couldn't export to {os.path.basename(file)}. {e}", parent=self)
+            return
+        messagebox.showinfo('Export Connections', f'Exported {count} connections.', parent=self)
 
     def show_settings(self):
         '''
-        Loads the Settings window, then updates the GUI.
+        Loads the Settings window, then updates the GUI and schedules every connection to be checked.
         '''
         Toplevels.ShowSettings(self).wait_window()
         self.settings = self.get_saved_settings()
+        self._status_scheduler.request(self.available_connections)
+        self._status_scheduler.wake()
         self.update_info()
-        self.run_status_thread()
 
     def get_saved_settings(self):
         '''
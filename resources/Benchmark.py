@@ -0,0 +1,402 @@
+'''
+Benchmark harness for the VNC selector's scan and status checks. Starts fake VNC servers on
+loopback addresses (127.0.0.0/8), so everything runs on one Linux machine without a real network.
+
+Results are appended to a JSON lines file, and compared with the previous run of the same
+benchmark so regressions stand out.
+'''
+
+import argparse
+import json
+import os
+import platform
+import selectors
+import socket
+import struct
+import sys
+import tempfile
+import threading
+import time
+import ipaddress
+import bisect
+import random
+import resources.SelectorTools as SelectorTools
+import resources.Resolvers as Resolvers
+
+RESULTS_FILE = 'benchmark_results.jsonl'
+RFB_VERSION = b'RFB 003.008\n'
+
+
+class FakeVNCServers(object):
+    '''
+    Runs many fake VNC servers on loopback addresses from a single selector thread.\n
+    Each server behaves in one of these modes:
+      'rfb':  Accepts, waits accept_delay seconds, then sends an RFB 3.8 banner and security types
+              (VNC authentication), like a Tight VNC server.
+      'hold':  Accepts and never sends anything, like a firewall which accepts and holds connections.
+      'reset':  Accepts, then immediately resets the connection.
+      'drop':  Never answers. The listen queue is kept full, so connection attempts are silently dropped.
+    Addresses with no server reset connection attempts (connection refused).
+    '''
+    def __init__(self, accept_delay:float=0.0):
+        '''
+        args:
+          accept_delay (float):  Seconds 'rfb' servers wait before sending their banner. (default 0)
+        '''
+        self.accept_delay = accept_delay
+        self._selector = selectors.DefaultSelector()
+        self._listeners = []
+        self._fillers = []  # Client sockets keeping the 'drop' listen queues full.
+        self._delayed = []  # (send time, socket) for 'rfb' banners waiting on accept_delay.
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def add(self, address:str, port:int, mode:str='rfb'):
+        '''
+        Starts a fake server listening on the provided address and port.
+        '''
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listener.bind((address, port))
+        if mode == 'drop':
+            listener.listen(0)
+            for _ in range(3):
+                filler = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                filler.setblocking(False)
+                filler.connect_ex((address, port))
+                self._fillers.append(filler)
+        else:
+            listener.listen(128)
+            listener.setblocking(False)
+            with self._lock:
+                self._selector.register(listener, selectors.EVENT_READ, ('listener', mode))
+        self._listeners.append(listener)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        for s in self._listeners + self._fillers:
+            s.close()
+        for key in list(self._selector.get_map().values()):
+            key.fileobj.close()
+        self._selector.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _run(self):
+        while not self._stop.is_set():
+            with self._lock:
+                events = self._selector.select(0.01)
+            for key, _ in events:
+                kind, mode = key.data
+                if kind == 'listener':
+                    self._accept(key.fileobj, mode)
+                else:
+                    self._close(key.fileobj)
+            now = time.monotonic()
+            due = [s for when, s in self._delayed if when <= now]
+            self._delayed = [(when, s) for when, s in self._delayed if when > now]
+            for s in due:
+                self._send_banner(s)
+
+    def _accept(self, listener, mode):
+        try:
+            s, _ = listener.accept()
+        except OSError:
+            return
+        s.setblocking(False)
+        if mode == 'reset':
+            s.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack('ii', 1, 0))
+            s.close()
+        elif mode == 'rfb' and self.accept_delay > 0:
+            self._delayed.append((time.monotonic() + self.accept_delay, s))
+        elif mode == 'rfb':
+            self._send_banner(s)
+        else:
+            self._selector.register(s, selectors.EVENT_READ, ('client', mode))
+
+    def _send_banner(self, s):
+        try:
+            s.send(RFB_VERSION + b'\x01\x02')  # Version, then one security type: VNC authentication.
+        except OSError:
+            s.close()
+            return
+        self._selector.register(s, selectors.EVENT_READ, ('client', 'rfb'))
+
+    def _close(self, s):
+        try:
+            data = s.recv(4096)
+        except OSError:
+            data = b''
+        if not data:
+            self._selector.unregister(s)
+            s.close()
+
+
+def percentiles(values:list):
+    '''
+    Returns a {'p50', 'p90', 'p99', 'max'} dict of the provided values, in milliseconds.
+    '''
+    if not values:
+        return {'p50': None, 'p90': None, 'p99': None, 'max': None}
+    values = sorted(values)
+    pick = lambda p: round(values[min(len(values) - 1, int(p * len(values)))] * 1000, 3)
+    return {'p50': pick(0.50), 'p90': pick(0.90), 'p99': pick(0.99), 'max': round(values[-1] * 1000, 3)}
+
+def layout(base:str, live:int, drop:int, closed:int, hold:int=0, reset:int=0):
+    '''
+    Returns a list of (address, mode) pairs, numbering addresses up from base. mode is None for
+    addresses with no server.
+    '''
+    modes = ['rfb'] * live + ['hold'] * hold + ['reset'] * reset + ['drop'] * drop + [None] * closed
+    first = int(ipaddress.IPv4Address(base))
+    return [(str(ipaddress.IPv4Address(first + i)), mode) for i, mode in enumerate(modes)]
+
+def neighbor_fixture(addresses:list):
+    '''
+    Returns the text of a /proc/net/arp file listing every address which has a server, as a completed
+    entry, and every address without one as an incomplete entry.
+    '''
+    lines = ['IP address       HW type     Flags       HW address            Mask     Device']
+    for i, (address, mode) in enumerate(addresses):
+        flags, hw_address = ('0x2', '02:00:00:{:02x}:{:02x}:{:02x}'.format(i >> 16 & 255, i >> 8 & 255, i & 255)) if mode else ('0x0', '00:00:00:00:00:00')
+        lines.append(f'{address:<16} 0x1         {flags:<11} {hw_address}     *        lo')
+    return '\n'.join(lines) + '\n'
+
+def bench_scan(addresses:list, port:int, concurrency:int, resolve:bool=False, handshake:bool=False, neighbors:str=None):
+    '''
+    Times a full SelectorTools.scan() of the provided addresses. If resolve is True the reverse-DNS
+    cache starts cold, otherwise every address is cached as having no name, so only probing is timed.
+    With neighbors ('first' or 'only'), the neighbor table is read from a neighbor_fixture() file.
+    '''
+    neighbor_table = None
+    if neighbors:
+        with tempfile.NamedTemporaryFile('w', suffix='.arp', delete=False) as f:
+            f.write(neighbor_fixture(addresses))
+        neighbor_table = SelectorTools.read_neighbor_table(f.name)
+        os.remove(f.name)
+    targets = f'{addresses[0][0]}-{addresses[-1][0]}'
+    resolver = Resolvers.ReverseResolver()
+    if not resolve:
+        for address, _ in addresses:
+            resolver.remember(address, '')
+    completed = []
+    start = time.perf_counter()
+    alive = 0
+    for item in SelectorTools.scan(port=port, targets=targets, max_concurrency=concurrency, resolver=resolver, handshake=handshake,
+                                   neighbors=neighbors, neighbor_table=neighbor_table):
+        completed.append(time.perf_counter() - start)
+        alive += item['alive']
+    duration = time.perf_counter() - start
+    return {'addresses': len(completed), 'alive': alive, 'duration s': round(duration, 4),
+            'addresses per s': round(len(completed) / duration, 1), 'completion': percentiles(completed),
+            'ptr queries': resolver.queries}
+
+def bench_is_alive(addresses:list, port:int, handshake:bool=False):
+    '''
+    Times SelectorTools.is_alive() on each of the provided addresses, one after another.
+    '''
+    latencies = []
+    alive = 0
+    start = time.perf_counter()
+    for address, _ in addresses:
+        probe_start = time.perf_counter()
+        alive += SelectorTools.is_alive(address, port, handshake)
+        latencies.append(time.perf_counter() - probe_start)
+    duration = time.perf_counter() - start
+    return {'probes': len(latencies), 'alive': alive, 'duration s': round(duration, 4),
+            'probes per s': round(len(latencies) / duration, 1), 'latency': percentiles(latencies)}
+
+def bench_status(addresses:list, port:int, workers:int):
+    '''
+    Times a SelectorTools.check_status() refresh of connections for each of the provided addresses.
+    '''
+    connections = [(f'conn {i}', {'hostname': '', 'ip address': address, 'vnc port': str(port)})
+                   for i, (address, _) in enumerate(addresses)]
+    completed = []
+    alive = 0
+    start = time.perf_counter()
+    for _, is_alive in SelectorTools.check_status(connections, workers):
+        completed.append(time.perf_counter() - start)
+        alive += is_alive
+    duration = time.perf_counter() - start
+    return {'connections': len(completed), 'alive': alive, 'duration s': round(duration, 4),
+            'connections per s': round(len(completed) / duration, 1), 'completion': percentiles(completed)}
+
+def simulate_schedule(scheduler_options:dict, hosts:int, down:float, flapping:float, duration:float, seed:int=1):
+    '''
+    Simulates duration seconds of SelectorTools.StatusScheduler checks, on a simulated clock, for hosts
+    connections: a down fraction which never answer, a flapping fraction which change state on average
+    every 10 minutes, and the rest always up. Returns the number of probes and the delays (in seconds)
+    between each flapping host changing state and a probe seeing it.
+    '''
+    rng = random.Random(seed)
+    clock = [0.0]
+    scheduler = SelectorTools.StatusScheduler(clock=lambda: clock[0], **scheduler_options)
+    down_count, flapping_count = int(hosts * down), int(hosts * flapping)
+    transitions = {}  # Flapping host -> sorted list of times it changed state.
+    for host in range(down_count, down_count + flapping_count):
+        t, times = 0.0, []
+        while t < duration:
+            t += rng.expovariate(1 / 600)
+            times.append(t)
+        transitions[host] = times
+
+    def alive(host, t):
+        if host < down_count:
+            return False
+        if host in transitions:
+            return bisect.bisect_right(transitions[host], t) % 2 == 0
+        return True
+
+    for host in range(hosts):
+        scheduler.add(host)
+    probes = 0
+    seen = {}
+    delays = []
+    while True:
+        due = scheduler.next_due()
+        if due is None or due > duration:
+            break
+        clock[0] = due
+        for host in scheduler.pop_due():
+            probes += 1
+            state = alive(host, due)
+            if host in transitions and host in seen and seen[host] != state:
+                times = transitions[host]
+                delays.append(due - times[bisect.bisect_right(times, due) - 1])
+            seen[host] = state
+            scheduler.report(host, state)
+    return probes, delays
+
+def bench_schedule(hosts:int, down:float=0.3, flapping:float=0.02, duration:float=86400):
+    '''
+    Compares the status scheduler's probe load and change detection delay with checking every host every
+    60 seconds, over a simulated day. No network is used.
+    '''
+    start = time.perf_counter()
+    probes, delays = simulate_schedule({}, hosts, down, flapping, duration)
+    fixed = {'max_interval': 60, 'max_up_interval': 60, 'recheck': 60, 'unstable_interval': 60, 'jitter': 0}
+    fixed_probes, fixed_delays = simulate_schedule(fixed, hosts, down, flapping, duration)
+    return {'hosts': hosts, 'simulated s': duration, 'probes': probes, 'fixed 60 s probes': fixed_probes,
+            'probe ratio': round(probes / fixed_probes, 3), 'detection delay': percentiles(delays),
+            'fixed 60 s detection delay': percentiles(fixed_delays), 'duration s': round(time.perf_counter() - start, 4)}
+
+def bench_launch(count:int, workers:int):
+    '''
+    Times launching count viewers at once through SelectorTools.ViewerLauncher. The Python interpreter stands
+    in for the viewer: it starts, fails to open the 'host::port' argument as a script, and exits.
+    '''
+    connections = [(f'conn {i}', {'hostname': '', 'ip address': '127.0.0.1', 'vnc password': '', 'vnc port': '5900'})
+                   for i in range(count)]
+    launcher = SelectorTools.ViewerLauncher(workers, sys.executable)
+    start = time.perf_counter()
+    results = list(launcher.launch_many(connections))
+    duration = time.perf_counter() - start
+    launcher.shutdown()
+    return {'launches': count, 'launched': sum(result['launched'] for result in results), 'duration s': round(duration, 4),
+            'launches per s': round(count / duration, 1), 'latency': percentiles([result['latency s'] for result in results])}
+
+def _previous(file:str, name:str, config:dict):
+    '''
+    Returns the most recent stored result with the same benchmark name and configuration, or None.
+    '''
+    if not os.path.isfile(file):
+        return None
+    previous = None
+    with open(file) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if record.get('benchmark') == name and record.get('config') == config:
+                previous = record
+    return previous
+
+def _compare(result:dict, previous:dict):
+    '''
+    Returns a list of 'key: old -> new (+x%)' strings for the numeric results which changed.
+    '''
+    changes = []
+    def walk(new, old, prefix=''):
+        for key, value in new.items():
+            if isinstance(value, dict) and isinstance(old.get(key), dict):
+                walk(value, old[key], f'{prefix}{key} ')
+            elif isinstance(value, (int, float)) and isinstance(old.get(key), (int, float)) and old[key] != value:
+                change = f' ({(value - old[key]) / old[key] * 100:+.1f}%)' if old[key] else ''
+                changes.append(f'{prefix}{key}: {old[key]} -> {value}{change}')
+    walk(result, previous)
+    return changes
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='VNC_Selector_Benchmark', description='Benchmark scan and status checks against fake VNC servers on loopback.')
+    parser.add_argument('benchmarks', nargs='*', metavar='benchmark', help='Benchmarks to run: scan, is_alive, status, schedule and/or launch. (default all)')
+    parser.add_argument('--base', default='127.10.0.1', help='First loopback address used. (default %(default)s)')
+    parser.add_argument('--port', type=int, default=5900, help='Port the fake servers listen on. (default %(default)s)')
+    parser.add_argument('--live', type=int, default=50, help='Number of fake VNC servers. (default %(default)s)')
+    parser.add_argument('--hold', type=int, default=0, help='Number of servers which accept and never answer. (default %(default)s)')
+    parser.add_argument('--reset', type=int, default=0, help='Number of servers which accept, then reset. (default %(default)s)')
+    parser.add_argument('--drop', type=int, default=20, help='Number of addresses which silently drop connections. (default %(default)s)')
+    parser.add_argument('--closed', type=int, default=184, help='Number of addresses which refuse connections. (default %(default)s)')
+    parser.add_argument('--accept-delay', type=float, default=0.0, help='Seconds fake VNC servers wait before sending their banner. (default %(default)s)')
+    parser.add_argument('--handshake', action='store_true', help='Probe with the RFB handshake in the scan and is_alive benchmarks.')
+    parser.add_argument('--neighbors', choices=SelectorTools.NEIGHBOR_MODES, default=None,
+                        help='Scan benchmark probes hosts in a fixture neighbor table first, or only those.')
+    parser.add_argument('--resolve', action='store_true', help='Include reverse-DNS lookups in the scan benchmark.')
+    parser.add_argument('--concurrency', type=int, default=SelectorTools.SCAN_CONCURRENCY, help='scan() concurrency. (default %(default)s)')
+    parser.add_argument('--workers', type=int, default=SelectorTools.DEFAULT_SETTINGS['status workers'], help='Status check workers. (default %(default)s)')
+    parser.add_argument('--hosts', type=int, default=1000, help='Connections simulated by the schedule benchmark. (default %(default)s)')
+    parser.add_argument('--launches', type=int, default=20, help='Viewers started by the launch benchmark. (default %(default)s)')
+    parser.add_argument('--launch-workers', type=int, default=SelectorTools.LAUNCH_WORKERS, help='Launch benchmark workers. (default %(default)s)')
+    parser.add_argument('--output', default=RESULTS_FILE, help='JSON lines file results are appended to. (default %(default)s)')
+    parser.add_argument('--no-save', action='store_true', help='Don\'t store the results.')
+    return parser
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    args.benchmarks = args.benchmarks or ['scan', 'is_alive', 'status', 'schedule', 'launch']
+    for name in args.benchmarks:
+        if name not in ('scan', 'is_alive', 'status', 'schedule', 'launch'):
+            parser.error(f'unknown benchmark: {name}')
+    addresses = layout(args.base, args.live, args.drop, args.closed, args.hold, args.reset)
+    config = {key: value for key, value in vars(args).items() if key not in ('benchmarks', 'output', 'no_save')}
+    servers = FakeVNCServers(args.accept_delay)
+    for address, mode in addresses:
+        if mode is not None:
+            servers.add(address, args.port, mode)
+    with servers:
+        for name in args.benchmarks:
+            if name == 'scan':
+                result = bench_scan(addresses, args.port, args.concurrency, args.resolve, args.handshake, args.neighbors)
+            elif name == 'launch':
+                result = bench_launch(args.launches, args.launch_workers)
+            elif name == 'schedule':
+                result = bench_schedule(args.hosts)
+            elif name == 'is_alive':
+                result = bench_is_alive(addresses, args.port, args.handshake)
+            else:
+                result = bench_status(addresses, args.port, args.workers)
+            record = {'benchmark': name, 'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'python': platform.python_version(),
+                      'config': config, 'result': result}
+            print(json.dumps(record))
+            previous = _previous(args.output, name, config)
+            if previous is not None:
+                for change in _compare(result, previous['result']):
+                    print(f'  {name} {change}', file=sys.stderr)
+            if not args.no_save:
+                with open(args.output, 'a') as f:
+                    f.write(json.dumps(record) + '\n')
+    return 0
@@ -0,0 +1,185 @@
+'''
+Headless command line interface for the VNC selector. Results are written to stdout as
+newline-delimited JSON, one object per line, as soon as they are available.
+
+Does not import tkinter or PIL, so it runs on machines without a display.
+'''
+
+import argparse
+import json
+import os
+import sys
+import resources.SelectorTools as SelectorTools
+import resources.Resolvers as Resolvers
+import resources.Inventory as Inventory
+import resources.Metrics as Metrics
+import resources.Tracing as Tracing
+
+
+def _emit(record:dict):
+    '''
+    Writes one record to stdout as a line of JSON.
+    '''
+    sys.stdout.write(json.dumps(record) + '\n')
+    sys.stdout.flush()
+
+def _scan(args):
+    if args.targets:
+        targets = args.targets
+    else:
+        network = '.'.join(SelectorTools.get_this_pc_info()['ip'].split('.')[:-1])
+        targets = [f'{network}.1-{network}.255']
+    ranges = SelectorTools.parse_targets(targets, args.exclude)
+    neighbor_table = SelectorTools.read_neighbor_table(args.neighbor_table) if args.neighbors else None
+    if args.incremental:
+        skip_empty_for = args.skip_empty_minutes * 60 if args.skip_empty_minutes is not None else None
+        results = SelectorTools.incremental_scan(ranges, args.port, cache=SelectorTools.get_scan_cache(args.scan_cache),
+                                                 skip_empty_for=skip_empty_for, shuffle=args.shuffle, rate=args.rate,
+                                                 max_concurrency=args.concurrency, handshake=args.handshake,
+                                                 neighbors=args.neighbors, neighbor_table=neighbor_table)
+    else:
+        results = SelectorTools.scan(port=args.port, targets=ranges, shuffle=args.shuffle, rate=args.rate,
+                                     max_concurrency=args.concurrency, handshake=args.handshake,
+                                     neighbors=args.neighbors, neighbor_table=neighbor_table)
+    for item in results:
+        if item['alive'] or item.get('change') or args.all:
+            _emit(item)
+    Resolvers.reverse_resolver.save()
+    return 0
+
+def _status(args):
+    connections = SelectorTools.get_connection_store(args.data)
+    selected = [(name, connections[name]) for name in args.names] if args.names else connections.items()
+    for name, alive in SelectorTools.check_status(selected, args.workers, args.handshake):
+        connection = connections[name]
+        _emit({'name': name, 'hostname': connection['hostname'], 'ip': connection['ip address'],
+               'port': connection['vnc port'], 'alive': alive})
+    return 0
+
+def _connect(args):
+    connections = SelectorTools.get_connection_store(args.data)
+    status = 0
+    found = []
+    for name in args.names:
+        connection = connections.get(name)
+        if connection is None:
+            _emit({'name': name, 'launched': False, 'error': 'No connection with that name.'})
+            status = 1
+        else:
+            found.append((name, connection))
+    launcher = SelectorTools.ViewerLauncher(args.workers, args.viewer)
+    for result in launcher.launch_many(found):
+        _emit(result)
+        if not result['launched']:
+            status = 1
+    return status
+
+def _import(args):
+    format = args.format or Inventory.detect_format(args.file)
+
+    def skipped(number, record, reason):
+        if isinstance(record, dict):
+            record = {key: value for key, value in record.items() if key != 'vnc password'}
+        _emit({'record': number, 'imported': False, 'error': reason, 'data': record})
+    with open(args.file, newline='', encoding='utf-8-sig') as f:
+        summary = Inventory.import_connections(SelectorTools.get_connection_store(args.data), f, format, skipped)
+    _emit(summary)
+    return 0
+
+def _export(args):
+    if args.file == '-':
+        Inventory.export_connections(SelectorTools.get_connection_store(args.data), sys.stdout, args.format or 'ndjson', args.passwords)
+        return 0
+    format = args.format or Inventory.detect_format(args.file)
+    temp = f'{args.file}.tmp'
+    with open(temp, 'w', newline='', encoding='utf-8') as f:
+        count = Inventory.export_connections(SelectorTools.get_connection_store(args.data), f, format, args.passwords)
+    os.replace(temp, args.file)
+    _emit({'file': args.file, 'exported': count})
+    return 0
+
+def build_parser():
+    '''
+    Returns the argparse.ArgumentParser for the command line interface.
+    '''
+    parser = argparse.ArgumentParser(prog='VNC_Selector_CLI', description='Scan for, check and connect to Tight VNC servers.')
+    parser.add_argument('--data', default=SelectorTools.DATA_FILE, help='Connections database file. (default %(default)s)')
+    parser.add_argument('--metrics-port', type=int, default=None, help='Serve Prometheus metrics at http://127.0.0.1:PORT/metrics while running.')
+    parser.add_argument('--metrics-file', default=None, help='Write metrics to this JSON file when the command finishes.')
+    parser.add_argument('--trace', default=None, help='Write a Chrome trace of the command to this file, for chrome://tracing or ui.perfetto.dev.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    scan_parser = subparsers.add_parser('scan', help='Scan for Tight VNC servers.')
+    scan_parser.add_argument('targets', nargs='*', help='Target expressions, e.g. 10.20.0.0/16 10.1.4.10-10.1.7.200. (default this PC\'s /24)')
+    scan_parser.add_argument('--exclude', nargs='*', default=None, help='Target expressions to skip.')
+    scan_parser.add_argument('--port', default='5900', help='Ports to probe, e.g. 5900-5910,5800. (default %(default)s)')
+    scan_parser.add_argument('--rate', type=float, default=None, help='Maximum probes started per second.')
+    scan_parser.add_argument('--concurrency', type=int, default=SelectorTools.SCAN_CONCURRENCY, help='Maximum probes in flight. (default %(default)s)')
+    scan_parser.add_argument('--shuffle', action='store_true', help='Scan addresses in a random order.')
+    scan_parser.add_argument('--handshake', action='store_true', help='Only report servers which answer with an RFB banner, with their version and auth types.')
+    scan_parser.add_argument('--neighbors', choices=SelectorTools.NEIGHBOR_MODES, default=None,
+                             help='Probe addresses in the ARP neighbor table first, or only those.')
+    scan_parser.add_argument('--neighbor-table', default=SelectorTools.NEIGHBOR_TABLE_FILE,
+                             help='Neighbor table file in /proc/net/arp format. (default %(default)s)')
+    scan_parser.add_argument('--incremental', action='store_true',
+                             help='Use and update the results of earlier scans: report changes, and skip addresses recently found empty.')
+    scan_parser.add_argument('--scan-cache', default=SelectorTools.Storage.SCAN_CACHE_FILE,
+                             help='With --incremental, the scan result database file. (default %(default)s)')
+    scan_parser.add_argument('--skip-empty-minutes', type=float, default=None,
+                             help='With --incremental, minutes an empty address is skipped for. (default the \'scan cache minutes\' setting)')
+    scan_parser.add_argument('--all', action='store_true', help='Also output addresses which did not answer.')
+    scan_parser.set_defaults(func=_scan)
+
+    status_parser = subparsers.add_parser('status', help='Check whether known connections are available.')
+    status_parser.add_argument('names', nargs='*', help='Connection names to check. (default all)')
+    status_parser.add_argument('--workers', type=int, default=SelectorTools.DEFAULT_SETTINGS['status workers'], help='Maximum connections checked at once. (default %(default)s)')
+    status_parser.add_argument('--handshake', action='store_true', help='Only report servers which answer with an RFB banner as alive.')
+    status_parser.set_defaults(func=_status)
+
+    connect_parser = subparsers.add_parser('connect', help='Launch the viewer for known connections.')
+    connect_parser.add_argument('names', nargs='+', help='Connection names to connect to.')
+    connect_parser.add_argument('--viewer', default=None, help='Viewer executable. (default the VNC_SELECTOR_VIEWER environment variable, the \'viewer path\' setting or TightVNC\'s install path)')
+    connect_parser.add_argument('--workers', type=int, default=SelectorTools.LAUNCH_WORKERS, help='Maximum viewers started at once. (default %(default)s)')
+    connect_parser.set_defaults(func=_connect)
+
+    import_parser = subparsers.add_parser('import', help='Add connections from a CSV, JSON or newline-delimited JSON file.')
+    import_parser.add_argument('file', help='File to import.')
+    import_parser.add_argument('--format', choices=Inventory.FORMATS, default=None, help='File format. (default from the file extension)')
+    import_parser.set_defaults(func=_import)
+
+    export_parser = subparsers.add_parser('export', help='Write every connection to a CSV, JSON or newline-delimited JSON file.')
+    export_parser.add_argument('file', help='File to write, or - for stdout.')
+    export_parser.add_argument('--format', choices=Inventory.FORMATS, default=None, help='File format. (default from the file extension, or ndjson for stdout)')
+    export_parser.add_argument('--passwords', action='store_true', help='Include VNC passwords.')
+    export_parser.set_defaults(func=_export)
+    return parser
+
+def main(argv=None):
+    '''
+    Runs the command line interface. Returns the process exit status.
+
+    args:
+      argv (list):  Command line arguments, excluding the program name. (default sys.argv[1:])
+    '''
+    args = build_parser().parse_args(argv)
+    Tracing.configure_from_environment()
+    if args.trace is not None:
+        Tracing.start(args.trace)
+    Metrics.configure_from_environment()
+    if args.metrics_port is not None:
+        Metrics.start_http_server(args.metrics_port)
+    if args.metrics_file is not None:
+        Metrics.enabled = True
+    try:
+        return args.func(args)
+    except ValueError as e:
+        sys.stderr.write(f'error: {e}\n')
+        return 2
+    except KeyError as e:
+        sys.stderr.write(f'error: no connection named {e}\n')
+        return 2
+    except (BrokenPipeError, KeyboardInterrupt):
+        return 1
+    finally:
+        if args.metrics_file is not None:
+            Metrics.write_json(args.metrics_file)
@@ -0,0 +1,262 @@
+'''
+Bulk import and export of the VNC selector's known connections, as CSV, JSON or newline-delimited JSON.
+
+Files are read and written one record at a time, so very large inventories can be moved without holding
+the whole file in memory. Imports are validated, skip records which duplicate a known connection, and
+are committed in a single transaction.
+'''
+
+import os
+import csv
+import json
+import ipaddress
+import functools
+import resources.Tracing as Tracing
+
+FORMATS = ('csv', 'json', 'ndjson')
+FIELDS = ('name', 'hostname', 'ip address', 'vnc port', 'vnc password')
+_EXTENSIONS = {'.csv': 'csv', '.json': 'json', '.ndjson': 'ndjson', '.jsonl': 'ndjson'}
+_ALIASES = {
+    'host': 'hostname',
+    'ip': 'ip address',
+    'address': 'ip address',
+    'port': 'vnc port',
+    'password': 'vnc password'
+}
+_READ_SIZE = 65536
+
+
+def detect_format(file:str):
+    '''
+    Returns the format of the provided file from its extension. Raises ValueError if it isn't recognised.
+    '''
+    extension = os.path.splitext(file)[1].lower()
+    if extension not in _EXTENSIONS:
+        raise ValueError(f'Unknown file type {extension!r}, expected one of {", ".join(_EXTENSIONS)}.')
+    return _EXTENSIONS[extension]
+
+@functools.lru_cache(maxsize=256)
+def _normalize_key(key:str):
+    key = ' '.join(key.strip().lower().replace('_', ' ').replace('-', ' ').split())
+    return _ALIASES.get(key, key)
+
+def _normalize(record:dict):
+    '''
+    Returns a copy of record with keys lower case, '_' and '-' read as spaces, and aliases such as 'ip'
+    or 'port' replaced by the connection dict keys.
+    '''
+    # Extra CSV columns without a header have the key None.
+    return {_normalize_key(str(key)): value for key, value in record.items() if key is not None}
+
+def _read_json_array(f):
+    '''
+    Generator.\n
+    Yields each element of the JSON array in f, reading it in chunks.
+    '''
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    eof = False
+
+    def more():
+        nonlocal buffer, position, eof
+        chunk = f.read(_READ_SIZE)
+        buffer = buffer[position:] + chunk
+        position = 0
+        eof = chunk == ''
+
+    def skip(characters):
+        nonlocal position
+        while True:
+            while position < len(buffer) and buffer[position] in characters:
+                position += 1
+            if position < len(buffer) or eof:
+                return
+            more()
+
+    more()
+    skip(' \t\r\n\ufeff')
+    if buffer[position:position + 1] != '[':
+        raise ValueError('Expected a JSON array of connections.')
+    position += 1
+    first = True
+    while True:
+        skip(' \t\r\n')
+        if eof and position >= len(buffer):
+            raise ValueError('Unexpected end of JSON array.')
+        if buffer[position] == ']':
+            return
+        if not first:
+            if buffer[position] != ',':
+                raise ValueError(f'Expected "," or "]" in JSON array, found {buffer[position]!r}.')
+            position += 1
+            skip(' \t\r\n')
+        first = False
+        while True:
+            try:
+                value, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                more()
+                continue
+            if end == len(buffer) and not eof:
+                more()  # A number may continue in the next chunk.
+                continue
+            position = end
+            break
+        yield value
+
+def _read_json_lines(f):
+    '''
+    Generator.\n
+    Yields the JSON value on each non-blank line of f, or the line itself if it isn't valid JSON.
+    '''
+    for line in f:
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError:
+            yield line.rstrip('\n')
+
+def read_records(f, format:str):
+    '''
+    Generator.\n
+    Yields (record number, record dict) for each record in an open text file, with normalized keys
+    (see FIELDS). Records which aren't JSON objects are yielded as they are, for validate() to reject.
+
+    args:
+      f (file):  The file, opened for reading as text (with newline='' for CSV).
+      format (str):  One of FORMATS.
+    '''
+    if format == 'csv':
+        records = csv.DictReader(f)
+    elif format == 'json':
+        records = _read_json_array(f)
+    elif format == 'ndjson':
+        records = _read_json_lines(f)
+    else:
+        raise ValueError(f'Unknown format {format!r}, expected one of {", ".join(FORMATS)}.')
+    for number, record in enumerate(records, 1):
+        yield number, _normalize(record) if isinstance(record, dict) else record
+
+def validate(record:dict):
+    '''
+    Returns (name, connection dict) for a record read by read_records(). Raises ValueError if it isn't a
+    valid connection. As in the Add Connection window, a hostname or IP address is required, the name
+    defaults to the hostname or IP address, and the port defaults to 5900.
+    '''
+    if not isinstance(record, dict):
+        raise ValueError('Not an object.')
+    values = {}
+    for key in FIELDS:
+        value = record.get(key)
+        values[key] = '' if value is None else str(value).strip()
+    if not values['hostname'] and not values['ip address']:
+        raise ValueError('A hostname or IP address is required.')
+    if values['ip address']:
+        try:
+            ipaddress.IPv4Address(values['ip address'])
+        except ValueError:
+            raise ValueError(f'Invalid IP address {values["ip address"]!r}.')
+    port = values['vnc port'] or '5900'
+    if not port.isdigit() or not 0 < int(port) < 65536:
+        raise ValueError(f'Invalid port {port!r}.')
+    name = values['name'] or values['hostname'] or values['ip address']
+    return name, {
+        'hostname': values['hostname'],
+        'ip address': values['ip address'],
+        'vnc password': values['vnc password'],
+        'vnc port': str(int(port))}
+
+def import_connections(store, f, format:str, on_skip=None):
+    '''
+    Adds the connections in an open file to a Storage.ConnectionStore in a single transaction. Records
+    which are invalid, or which duplicate a known connection's name, or its hostname or IP address and
+    port, are skipped. Returns a summary dict of the 'read', 'imported' and 'skipped' record counts.
+
+    args:
+      store (ConnectionStore):  The store the connections are added to.
+      f (file):  The file, opened for reading as text (with newline='' for CSV).
+      format (str):  One of FORMATS.
+      on_skip (function):  Called as on_skip(record number, record, reason) for each skipped record. (default None)
+    '''
+    summary = {'read': 0, 'imported': 0, 'skipped': 0}
+
+    def skip(number, record, reason):
+        summary['skipped'] += 1
+        if on_skip is not None:
+            on_skip(number, record, reason)
+
+    def connections():
+        for number, record in read_records(f, format):
+            summary['read'] = number
+            try:
+                name, connection = validate(record)
+            except ValueError as e:
+                skip(number, record, str(e))
+                continue
+            connection['record'] = number
+            yield name, connection
+
+    def duplicate(name, connection, reason):
+        record = {key: value for key, value in connection.items() if key != 'record'}
+        record['name'] = name
+        skip(connection['record'], record, f'Duplicate {reason}.')
+
+    trace_start = Tracing.now()
+    summary['imported'] = store.insert_new(connections(), duplicate)
+    if Tracing.enabled:
+        Tracing.complete('import connections', 'storage', trace_start, dict(summary, format=format))
+    return summary
+
+def write_records(f, format:str, records, fields:tuple=FIELDS):
+    '''
+    Writes connection records to an open text file. Returns the number written.
+
+    args:
+      f (file):  The file, opened for writing as text (with newline='' for CSV).
+      format (str):  One of FORMATS.
+      records (iterable):  Dicts with the provided fields as keys.
+      fields (tuple):  The fields written, in order. (default FIELDS)
+    '''
+    count = 0
+    if format == 'csv':
+        writer = csv.DictWriter(f, fields, extrasaction='ignore')
+        writer.writeheader()
+        for record in records:
+            writer.writerow(record)
+            count += 1
+    elif format == 'json':
+        f.write('[')
+        for record in records:
+            f.write(',\n' if count else '\n')
+            f.write(json.dumps({key: record[key] for key in fields}))
+            count += 1
+        f.write('\n]\n' if count else ']\n')
+    elif format == 'ndjson':
+        for record in records:
+            f.write(json.dumps({key: record[key] for key in fields}) + '\n')
+            count += 1
+    else:
+        raise ValueError(f'Unknown format {format!r}, expected one of {", ".join(FORMATS)}.')
+    return count
+
+def export_connections(store, f, format:str, include_passwords:bool=False):
+    '''
+    Writes every connection in a Storage.ConnectionStore to an open file, sorted by name. Returns the
+    number written. Passwords are left out unless include_passwords is True.
+
+    args:
+      store (ConnectionStore):  The store to export.
+      f (file):  The file, opened for writing as text (with newline='' for CSV).
+      format (str):  One of FORMATS.
+      include_passwords (bool):  If True, include each connection's VNC password. (default False)
+    '''
+    fields = FIELDS if include_passwords else FIELDS[:-1]
+    connections = store.items()
+    connections.sort(key=lambda item: item[0])
+    records = (dict(connection, name=name) for name, connection in connections)
+    with Tracing.span('export connections', 'storage', format=format, connections=len(connections)):
+        return write_records(f, format, records, fields)
@@ -0,0 +1,231 @@
+'''
+Counters, gauges and latency histograms for the VNC selector, exposed in Prometheus text format
+through an optional local HTTP endpoint and/or written to a JSON file at a regular interval.
+
+Metrics are disabled by default. While disabled, instrumented code only checks the module level
+'enabled' flag, so the cost is close to zero.
+'''
+
+import os
+import atexit
+import json
+import time
+import threading
+import bisect
+import functools
+import itertools
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+enabled = False
+_registry = {}  # name -> metric, in declaration order.
+_lock = threading.Lock()
+
+
+class _Metric(object):
+    kind = ''
+
+    def __init__(self, name:str, help:str):
+        self.name = name
+        self.help = help
+        self._values = {}  # Sorted (label, value) tuple -> value.
+        self._lock = threading.Lock()
+        with _lock:
+            _registry[name] = self
+
+    def _samples(self):
+        with self._lock:
+            return list(self._values.items())
+
+
+class Counter(_Metric):
+    '''
+    A value which only goes up, e.g. the number of probes sent.
+    '''
+    kind = 'counter'
+
+    def inc(self, amount:float=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    '''
+    A value which can go up and down, e.g. the number of connections currently alive.
+    '''
+    kind = 'gauge'
+
+    def set(self, value:float, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    '''
+    Counts observed values, e.g. latencies in seconds, into cumulative buckets.
+    '''
+    kind = 'histogram'
+
+    def __init__(self, name:str, help:str, buckets:tuple=DEFAULT_BUCKETS):
+        _Metric.__init__(self, name, help)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value:float, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                # One count per bucket, plus one for values above the last bound. Made cumulative in _samples().
+                entry = self._values[key] = {'buckets': [0] * (len(self.buckets) + 1), 'count': 0, 'sum': 0.0}
+            entry['buckets'][bisect.bisect_left(self.buckets, value)] += 1
+            entry['count'] += 1
+            entry['sum'] += value
+
+    def _samples(self):
+        with self._lock:
+            return [(key, {'buckets': list(itertools.accumulate(entry['buckets'][:-1])), 'count': entry['count'], 'sum': entry['sum']})
+                    for key, entry in self._values.items()]
+
+
+def timed(histogram:Histogram, **labels):
+    '''
+    Decorator which observes the run time of each call in the provided histogram, while metrics are enabled.
+    '''
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return function(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - start, **labels)
+        return wrapper
+    return decorator
+
+def _format_labels(key, extra:tuple=()):
+    labels = list(key) + list(extra)
+    if not labels:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"')) for name, value in labels) + '}'
+
+def render_prometheus():
+    '''
+    Returns every metric in the Prometheus text exposition format.
+    '''
+    with _lock:
+        metrics = list(_registry.values())
+    lines = []
+    for metric in metrics:
+        lines.append(f'# HELP {metric.name} {metric.help}')
+        lines.append(f'# TYPE {metric.name} {metric.kind}')
+        for key, value in metric._samples():
+            if metric.kind != 'histogram':
+                lines.append(f'{metric.name}{_format_labels(key)} {value}')
+                continue
+            for bound, count in zip(metric.buckets, value['buckets']):
+                lines.append(f'{metric.name}_bucket{_format_labels(key, (("le", bound),))} {count}')
+            lines.append(f'{metric.name}_bucket{_format_labels(key, (("le", "+Inf"),))} {value["count"]}')
+            lines.append(f'{metric.name}_sum{_format_labels(key)} {value["sum"]}')
+            lines.append(f'{metric.name}_count{_format_labels(key)} {value["count"]}')
+    return '\n'.join(lines) + '\n'
+
+def snapshot():
+    '''
+    Returns every metric as a JSON serializable dict.
+    '''
+    with _lock:
+        metrics = list(_registry.values())
+    data = {'time': time.time(), 'metrics': {}}
+    for metric in metrics:
+        samples = [{'labels': dict(key), 'value': value} for key, value in metric._samples()]
+        entry = {'type': metric.kind, 'help': metric.help, 'samples': samples}
+        if metric.kind == 'histogram':
+            entry['buckets'] = list(metric.buckets)
+        data['metrics'][metric.name] = entry
+    return data
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] == '/metrics':
+            body, content_type = render_prometheus().encode(), 'text/plain; version=0.0.4'
+        elif self.path.split('?')[0] == '/metrics.json':
+            body, content_type = json.dumps(snapshot()).encode(), 'application/json'
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_http_server(port:int, address:str='127.0.0.1'):
+    '''
+    Enables metrics, and serves them at http://address:port/metrics (Prometheus text format) and
+    /metrics.json from a background thread. Returns the server.
+
+    args:
+      port (int):  The port to listen on.
+      address (str):  The address to listen on. (default '127.0.0.1', local connections only)
+    '''
+    global enabled
+    enabled = True
+    server = ThreadingHTTPServer((address, port), _Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def write_json(file:str):
+    '''
+    Writes a snapshot() of the metrics to the provided file, replacing it atomically.
+    '''
+    temp = f'{file}.tmp'
+    with open(temp, 'w') as f:
+        json.dump(snapshot(), f)
+    os.replace(temp, file)
+
+def start_json_dump(file:str, interval:float=60):
+    '''
+    Enables metrics, and writes them to the provided JSON file every interval seconds from a background
+    thread, and once more when the program exits.
+
+    args:
+      file (str):  The file to write.
+      interval (float):  Seconds between writes. (default 60)
+    '''
+    global enabled
+    enabled = True
+
+    def dump():
+        while True:
+            time.sleep(interval)
+            try:
+                write_json(file)
+            except OSError:
+                pass
+    threading.Thread(target=dump, daemon=True).start()
+    atexit.register(write_json, file)
+
+def configure_from_environment():
+    '''
+    Starts the metrics outputs requested by environment variables:
+      VNC_SELECTOR_METRICS_PORT:  Port for start_http_server().
+      VNC_SELECTOR_METRICS_FILE:  File for start_json_dump(), written every VNC_SELECTOR_METRICS_INTERVAL
+                                  seconds (default 60).
+    '''
+    port = os.environ.get('VNC_SELECTOR_METRICS_PORT')
+    if port:
+        start_http_server(int(port))
+    file = os.environ.get('VNC_SELECTOR_METRICS_FILE')
+    if file:
+        start_json_dump(file, float(os.environ.get('VNC_SELECTOR_METRICS_INTERVAL', 60)))
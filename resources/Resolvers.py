@@ -0,0 +1,259 @@
+'''
+Cached, pooled name resolution used by the VNC selector.
+'''
+
+import os
+import socket
+import ipaddress
+import pathlib
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+import resources.Metrics as Metrics
+import resources.Tracing as Tracing
+
+NAMES_FILE = os.path.join('resources', 'names.dat')
+
+DNS_SECONDS = Metrics.Histogram('vnc_selector_dns_seconds', 'Time taken by each DNS query sent, by kind (forward or reverse).')
+
+
+class ReverseResolver(object):
+    '''
+    Resolves IP addresses to hostnames (PTR lookups) on its own thread pool, keeping a bounded
+    TTL cache of the results. Failed lookups are cached as '' for negative_ttl seconds.
+    '''
+    def __init__(self, max_workers:int=8, ttl:float=3600, negative_ttl:float=300, max_entries:int=4096, file:str=None):
+        '''
+        args:
+          max_workers (int):  Maximum number of lookups running at once. (default 8)
+          ttl (float):  Seconds a resolved name is kept. (default 3600)
+          negative_ttl (float):  Seconds a failed lookup is kept. (default 300)
+          max_entries (int):  Maximum number of cached addresses. Least recently used entries are dropped first. (default 4096)
+          file (str):  If provided, the cache is loaded from and saved to this file. (default None)
+        '''
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.file = file
+        self.queries = 0  # Number of PTR queries actually sent.
+        self._max_workers = max_workers
+        self._pool = None  # Assigned to ThreadPoolExecutor on first lookup_async().
+        self._cache = OrderedDict()  # ip -> (name, expires), expires is a time.time() value.
+        self._lock = threading.Lock()
+        self._loaded = file is None
+
+    def _load(self):
+        '''
+        Loads unexpired entries from the cache file, once.
+        '''
+        with self._lock:
+            if self._loaded:
+                return
+            self._loaded = True
+            if not pathlib.Path(self.file).is_file():
+                return
+            try:
+                with open(self.file, 'rb') as f:
+                    data = pickle.load(f)
+            except Exception:
+                return
+            now = time.time()
+            for ip, (name, expires) in data.items():
+                if expires > now:
+                    self._cache[ip] = (name, expires)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+
+    def save(self):
+        '''
+        Saves the unexpired cache entries to the cache file, if one was provided.
+        '''
+        if self.file is None:
+            return
+        self._load()
+        now = time.time()
+        with self._lock:
+            data = {ip: entry for ip, entry in self._cache.items() if entry[1] > now}
+        with open(self.file, 'wb') as f:
+            pickle.dump(data, f)
+
+    def cached(self, ip:str):
+        '''
+        Returns the cached name for the provided address ('' if the last lookup failed), or None if
+        the address is not cached or has expired.
+
+        args:
+          ip (str):  The IP address to look up.
+        '''
+        self._load()
+        with self._lock:
+            entry = self._cache.get(ip)
+            if entry is None:
+                return None
+            if entry[1] <= time.time():
+                del self._cache[ip]
+                return None
+            self._cache.move_to_end(ip)
+            return entry[0]
+
+    def remember(self, ip:str, name:str):
+        '''
+        Caches a name for the provided address, as if it had been looked up.
+
+        args:
+          ip (str):  The IP address.
+          name (str):  The hostname, or '' if the address has no name.
+        '''
+        with self._lock:
+            self._cache[ip] = (name, time.time() + (self.ttl if name else self.negative_ttl))
+            self._cache.move_to_end(ip)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+
+    def lookup(self, ip:str):
+        '''
+        Returns the hostname for the provided address, or '' if it can't be resolved. Blocks while
+        a PTR query is sent if the address isn't cached.
+
+        args:
+          ip (str):  The IP address to look up.
+        '''
+        name = self.cached(ip)
+        if name is not None:
+            return name
+        self.queries += 1
+        started = time.perf_counter()
+        with Tracing.span('reverse lookup', 'dns', ip=ip):
+            try:
+                name = socket.gethostbyaddr(ip)[0]
+            except (socket.herror, socket.gaierror, OSError):
+                name = ''
+        if Metrics.enabled:
+            DNS_SECONDS.observe(time.perf_counter() - started, kind='reverse')
+        self.remember(ip, name)
+        return name
+
+    def lookup_async(self, ip:str):
+        '''
+        Returns a concurrent.futures.Future which resolves to the hostname for the provided address.
+        Cached addresses return an already completed Future, without using the pool.
+
+        args:
+          ip (str):  The IP address to look up.
+        '''
+        name = self.cached(ip)
+        if name is not None:
+            future = Future()
+            future.set_result(name)
+            return future
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self._max_workers, thread_name_prefix='reverse-dns')
+        return self._pool.submit(self.lookup, ip)
+
+
+class HostResolver(object):
+    '''
+    Resolves hostnames to IPv4 address lists, keeping a TTL cache of the results. Failed lookups
+    are cached as [] for negative_ttl seconds. Once an entry expires its stale addresses keep being
+    returned while a fresh lookup runs in the background, so a slow or dead DNS server never blocks
+    a caller which has resolved the name before.
+    '''
+    def __init__(self, max_workers:int=16, ttl:float=300, negative_ttl:float=30):
+        '''
+        args:
+          max_workers (int):  Maximum number of lookups running at once. (default 16)
+          ttl (float):  Seconds resolved addresses are considered fresh. (default 300)
+          negative_ttl (float):  Seconds a failed lookup is kept. (default 30)
+        '''
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.queries = 0  # Number of DNS queries actually sent.
+        self._max_workers = max_workers
+        self._pool = None  # Assigned to ThreadPoolExecutor on first background lookup.
+        self._cache = {}  # hostname -> (addresses, expires), expires is a time.time() value.
+        self._in_flight = {}  # hostname -> Future of the lookup running for it.
+        self._lock = threading.Lock()
+
+    def _submit(self, hostname:str):
+        '''
+        Starts a background lookup of the provided hostname, unless one is already running. Returns the
+        lookup's Future, whose result is the list of addresses.
+        '''
+        with self._lock:
+            future = self._in_flight.get(hostname)
+            if future is not None:
+                return future
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self._max_workers, thread_name_prefix='forward-dns')
+            future = self._in_flight[hostname] = self._pool.submit(self._query, hostname)
+        return future
+
+    def _query(self, hostname:str):
+        '''
+        Sends a DNS query for the provided hostname and caches the result.
+        '''
+        self.queries += 1
+        started = time.perf_counter()
+        with Tracing.span('forward lookup', 'dns', hostname=hostname):
+            try:
+                info = socket.getaddrinfo(hostname, None, socket.AF_INET, socket.SOCK_STREAM)
+                addresses = list(dict.fromkeys(entry[4][0] for entry in info))
+            except (socket.gaierror, OSError, UnicodeError):
+                addresses = []
+        if Metrics.enabled:
+            DNS_SECONDS.observe(time.perf_counter() - started, kind='forward')
+        with self._lock:
+            stale = self._cache.get(hostname)
+            if addresses or stale is None or not stale[0]:
+                self._cache[hostname] = (addresses, time.time() + (self.ttl if addresses else self.negative_ttl))
+            else:
+                # Keep serving the last known addresses, and retry after negative_ttl.
+                addresses = stale[0]
+                self._cache[hostname] = (addresses, time.time() + self.negative_ttl)
+            self._in_flight.pop(hostname, None)
+        return addresses
+
+    def resolve(self, hostname:str):
+        '''
+        Returns the list of IPv4 addresses for the provided hostname ([] if it can't be resolved).
+        IP addresses are returned as-is. Blocks only if the hostname has never been resolved, waiting for
+        the prefetch() or other lookup already running for it, if there is one.
+
+        args:
+          hostname (str):  The hostname to resolve.
+        '''
+        try:
+            ipaddress.IPv4Address(hostname)
+            return [hostname]
+        except ValueError:
+            pass
+        with self._lock:
+            entry = self._cache.get(hostname)
+        if entry is None:
+            return self._submit(hostname).result()
+        if entry[1] <= time.time():
+            self._submit(hostname)
+        return entry[0]
+
+    def prefetch(self, hostnames):
+        '''
+        Starts background lookups for any of the provided hostnames which aren't cached yet. Does not block.
+
+        args:
+          hostnames (iterable):  The hostnames to resolve.
+        '''
+        for hostname in set(hostnames):
+            if hostname == '':
+                continue
+            with self._lock:
+                cached = hostname in self._cache
+            if not cached:
+                self._submit(hostname)
+
+
+# Shared resolver instances.
+reverse_resolver = ReverseResolver(file=NAMES_FILE)
+host_resolver = HostResolver()
@@ -4,34 +4,175 @@ Library of functions used by the VNC selector GUI.
 
 import os
 import socket
+import selectors
+import errno
+import time
+import math
+import random
+import bisect
+import heapq
+import ipaddress
 import pathlib
 import pickle
+import functools
+import threading
+import subprocess
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import resources.Resolvers as Resolvers
+import resources.Storage as Storage
+import resources.Metrics as Metrics
+import resources.Tracing as Tracing
 
-DATA_FILE = 'resources\\connections.dat'
-SETTINGS_FILE = 'resources\\settings.dat'
+DATA_FILE = Storage.DATABASE_FILE
+SETTINGS_FILE = os.path.join('resources', 'settings.dat')
+SCAN_TIMEOUT = 0.25  # Probe timeout for hosts with no measured round trip time.
+MIN_PROBE_TIMEOUT = 0.05
+MAX_PROBE_TIMEOUT = 3.0
+SCAN_CONCURRENCY = 256
+HANDSHAKE_TIMEOUT = 0.5
+VIEWER_PATH = 'C:\\Program Files\\TightVNC\\tvnviewer.exe'
+LAUNCH_WORKERS = 4
+SYNC_INTERVAL = 2  # Seconds between checks for connections changed by other instances sharing the data file.
+SYNC_TIMEOUT = 0.1  # Longest a check waits for another instance's lock on the data file, as it runs on the UI thread.
+NEIGHBOR_TABLE_FILE = '/proc/net/arp'  # Linux only. Other systems fall back to 'ip neigh' or 'arp -a'.
+NEIGHBOR_MODES = ('first', 'only')
+RFB_BANNER = b'RFB 003.008\n'
+RFB_SECURITY_TYPES = {
+    1: 'None',
+    2: 'VNC Authentication',
+    5: 'RA2',
+    6: 'RA2ne',
+    16: 'Tight',
+    18: 'TLS',
+    19: 'VeNCrypt',
+    30: 'Apple Remote Desktop'
+}
+PROBES = Metrics.Counter('vnc_selector_probes_total', 'Probes finished, by result (alive, closed or timeout).')
+PROBE_SECONDS = Metrics.Histogram('vnc_selector_probe_seconds', 'Time from starting a probe to its result.')
+IS_ALIVE_SECONDS = Metrics.Histogram('vnc_selector_is_alive_seconds', 'Time taken by is_alive(), including name resolution.')
+SCANS = Metrics.Counter('vnc_selector_scans_total', 'Network scans finished.')
+SCAN_SECONDS = Metrics.Histogram('vnc_selector_scan_seconds', 'Time taken by each network scan.',
+                                 (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900))
+SCAN_ADDRESSES = Metrics.Counter('vnc_selector_scan_addresses_total', 'Address and port pairs scanned, by whether they were alive.')
+DEFAULT_SETTINGS = {
+    'enable scan': 1,
+    'enable close': 0,
+    'status workers': 32,
+    'rfb handshake': 0,
+    'scan cache minutes': 60,
+    'status freshness': 10,
+    'viewer path': ''
+}
 
-def launch_viewer(target:str, password:str='', port=5900):
+def get_viewer_path(settings:dict=None):
     '''
-    Launches Tight VNC viewer using the provided host name, optional password and port.
+    Returns the viewer executable to launch: the VNC_SELECTOR_VIEWER environment variable if set, otherwise
+    the 'viewer path' setting if set, otherwise VIEWER_PATH.
+
+    args:
+      settings (dict):  The settings. (default get_settings_from_file())
+    '''
+    if os.environ.get('VNC_SELECTOR_VIEWER'):
+        return os.environ['VNC_SELECTOR_VIEWER']
+    settings = settings if settings is not None else get_settings_from_file()
+    return settings.get('viewer path') or VIEWER_PATH
+
+_viewers = []  # Viewer processes which may still be running.
+_viewers_lock = threading.Lock()
+
+def launch_viewer(target:str, password:str='', port=5900, viewer:str=None):
+    '''
+    Launches Tight VNC viewer using the provided host name, optional password and port, without a shell,
+    and returns the subprocess.Popen once it has started. Does not wait for the viewer to exit.
+    Raises OSError if the viewer can't be started.\n
+    TightVNC viewer only accepts a password on its command line, so it is visible to other programs
+    run by the same user while the viewer runs.
 
     args:
       target (str):  Hostname or IP of the target PC.
       password (str):  Password of the target PC TightVNC server.
       port (int):  Port number of the target PC TightVNC server. (default 5900)
+      viewer (str):  The viewer executable. (default get_viewer_path())
     '''
-    vnc_viewer_path = 'C:\\"Program Files"\\TightVNC\\tvnviewer.exe'
-    command = f'cmd /c start {vnc_viewer_path} {target}:{port}'
+    command = [viewer or get_viewer_path(), f'{target}::{port}']
     if password != '':
-        command += f' -password={password}'
-    try:
-        os.system(command)
-    except Exception as e:
-        raise e
+        command.append(f'-password={password}')
+    if os.name == 'nt':
+        options = {'creationflags': subprocess.DETACHED_PROCESS | subprocess.CREATE_NEW_PROCESS_GROUP}
+    else:
+        options = {'start_new_session': True}
+    with Tracing.span('launch viewer', 'launch', target=target, port=port):
+        process = subprocess.Popen(command, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                                   close_fds=True, **options)
+    with _viewers_lock:
+        # Reap viewers which have exited.
+        _viewers[:] = [running for running in _viewers if running.poll() is None]
+        _viewers.append(process)
+    return process
+
+class ViewerLauncher(object):
+    '''
+    Launches viewers on a bounded thread pool, so callers such as the Tk main thread never wait for a
+    process to start, and a batch of connections can be opened at once.
+    '''
+    def __init__(self, max_workers:int=LAUNCH_WORKERS, viewer:str=None):
+        '''
+        args:
+          max_workers (int):  Maximum number of viewers being started at once. (default LAUNCH_WORKERS)
+          viewer (str):  The viewer executable. (default get_viewer_path() at each launch)
+        '''
+        self.viewer = viewer
+        self._pool = ThreadPoolExecutor(max_workers=max(1, int(max_workers)), thread_name_prefix='viewer-launch')
+
+    def _launch(self, name:str, connection:dict):
+        target = connection['hostname'] if connection['hostname'] != '' else connection['ip address']
+        result = {'name': name, 'target': target, 'port': connection['vnc port'], 'launched': False}
+        started = time.perf_counter()
+        try:
+            addresses = Resolvers.host_resolver.resolve(target)
+            process = launch_viewer(addresses[0] if addresses else target, connection['vnc password'],
+                                    connection['vnc port'], self.viewer)
+            result['launched'] = True
+            result['pid'] = process.pid
+        except (OSError, ValueError, subprocess.SubprocessError) as e:
+            result['error'] = str(e)
+        result['latency s'] = round(time.perf_counter() - started, 4)
+        return result
+
+    def launch(self, name:str, connection:dict):
+        '''
+        Starts launching the viewer for a connection, resolving its hostname first. Returns a
+        concurrent.futures.Future of a {'name', 'target', 'port', 'launched', 'latency s'} dict, which also
+        has 'pid' if the viewer started, or 'error' if it didn't.
+
+        args:
+          name (str):  The connection name.
+          connection (dict):  The connection details.
+        '''
+        return self._pool.submit(self._launch, name, connection)
+
+    def launch_many(self, connections):
+        '''
+        Generator.\n
+        Launches the viewers for several connections concurrently, yielding each launch() result dict as it completes.
+
+        args:
+          connections (iterable):  (name, connection dict) pairs.
+        '''
+        futures = [self.launch(name, connection) for name, connection in connections]
+        for future in as_completed(futures):
+            yield future.result()
 
+    def shutdown(self):
+        self._pool.shutdown(wait=False)
+
+@functools.lru_cache(maxsize=None)
 def get_this_pc_info():
     '''
     Function that provides the PC hostname and IP address.\n
-    Returns a {'name': str, 'ip': str} dictionary.
+    Returns a {'name': str, 'ip': str} dictionary. The lookup is only done once, on first use,
+    so the returned dictionary must not be modified.
     '''
     try:
         hostname = socket.gethostname()
@@ -41,58 +182,1027 @@ def get_this_pc_info():
 
     return {'name':hostname, 'ip':ipaddress}
 
-def is_alive(address:str, port:int=5900):
+@Metrics.timed(IS_ALIVE_SECONDS)
+def is_alive(address:str, port:int=5900, handshake:bool=False):
     '''
-    Attempts to connect to a given IP address and port.\n
+    Attempts to connect to a given IP address and port, waiting up to rtt_estimator.timeout(address).\n
     Returns True if connection is successful, otherwise returns False.
 
     args:
-        address (str):  IP address of the target PC. Can also be hostname.
+        address (str):  IP address of the target PC. Can also be hostname, which is resolved through
+                        Resolvers.host_resolver.
         port (int):  Port which the Tight VNC service is broadcasting.
+        handshake (bool):  If True, the connection is only successful if the server sends an RFB banner.
+                           See probe_many(). (default False)
+    '''
+    addresses = Resolvers.host_resolver.resolve(address)
+    if not addresses:
+        return False
+    # The timeout adapts to the host's measured round trip time, see RttEstimator. The next check of a host
+    # which has never answered in time gets the longest timeout (at most once every escalate_interval), so
+    # one with a slow link can be measured.
+    return next(probe_many([(addresses[0], port)], None, 1, handshake=handshake, escalate=True))[2]
+
+def check_status(connections, max_workers:int=DEFAULT_SETTINGS['status workers'], handshake:bool=False):
+    '''
+    Generator.\n
+    Probes known connections concurrently, using their hostname if set, otherwise their IP address.\n
+    Yields a (name, alive) tuple for each connection, in the order the probes complete.
+
+    args:
+      connections (iterable):  (name, connection dict) pairs, e.g. from ConnectionStore.items().
+      max_workers (int):  Maximum number of connections probed at once.
+      handshake (bool):  If True, check for an RFB banner as well as a connection. See probe_many(). (default False)
+    '''
+    with Tracing.span('check status', 'status'), ThreadPoolExecutor(max_workers=max(1, int(max_workers))) as pool:
+        probes = {}
+        for name, connection in connections:
+            address = connection['hostname'] if connection['hostname'] != '' else connection['ip address']
+            try:
+                port = parse_port(connection.get('vnc port'))
+            except ValueError:
+                yield name, False  # Can't be reached until its port is corrected.
+                continue
+            probes[pool.submit(is_alive, address, port, handshake)] = name
+        for probe in as_completed(probes):
+            try:
+                alive = probe.result()
+            except (OSError, ValueError):
+                alive = False
+            yield probes[probe], alive
+
+class StatusScheduler(object):
+    '''
+    Decides when each known connection's status is next checked, using a priority queue of due times.\n
+    A connection's interval starts at interval seconds and doubles with each check while its state stays
+    the same, up to max_up_interval while it is alive and max_interval while it is down. After a
+    connection changes between up and down it is rechecked after recheck seconds, so the change is
+    confirmed quickly, and then every unstable_interval seconds until it has kept the same state for
+    unstable_for seconds, so flapping connections are followed closely. Every interval is randomized by +/- jitter (a fraction) so
+    checks don't bunch together.\n
+    Safe to use from several threads. A checking thread calls pop_due(), probes the returned names,
+    passes each result to report(), and calls wait() when nothing is due.
+    '''
+    def __init__(self, interval:float=60, max_interval:float=900, max_up_interval:float=300, recheck:float=5,
+                 unstable_interval:float=15, unstable_for:float=3600, jitter:float=0.1, clock=time.monotonic):
+        '''
+        args:
+          interval (float):  Shortest interval between checks of a connection which kept its state. (default 60)
+          max_interval (float):  Longest interval for a connection which stays down. (default 900)
+          max_up_interval (float):  Longest interval for a connection which stays alive. (default 300)
+          recheck (float):  Seconds until a connection which just changed state is checked again. (default 5)
+          unstable_interval (float):  Seconds between checks of a connection which changed state recently. (default 15)
+          unstable_for (float):  Seconds a connection counts as changed recently. (default 3600)
+          jitter (float):  Fraction each interval is randomly shortened or lengthened by. (default 0.1)
+          clock (function):  Returns the current time in seconds. (default time.monotonic)
+        '''
+        self.interval = interval
+        self.max_interval = max_interval
+        self.max_up_interval = max_up_interval
+        self.recheck = recheck
+        self.unstable_interval = unstable_interval
+        self.unstable_for = unstable_for
+        self.jitter = jitter
+        self.clock = clock
+        self._heap = []  # (due, sequence, name). Entries whose due time no longer matches _hosts are skipped.
+        self._hosts = {}  # name -> {'due', 'alive', 'interval', 'changed', 'checked'}, times are clock() values or None.
+        self._sequence = 0
+        self._condition = threading.Condition()
+
+    def __len__(self):
+        return len(self._hosts)
+
+    def __contains__(self, name):
+        return name in self._hosts
+
+    def __iter__(self):
+        with self._condition:
+            return iter(list(self._hosts))
+
+    def _push(self, name:str, due:float):
+        self._hosts[name]['due'] = due
+        self._sequence += 1
+        heapq.heappush(self._heap, (due, self._sequence, name))
+        self._condition.notify_all()
+
+    def add(self, name:str):
+        '''
+        Schedules a connection to be checked now. Connections already scheduled are moved to the front.
+        '''
+        with self._condition:
+            if name not in self._hosts:
+                self._hosts[name] = {'due': None, 'alive': None, 'interval': self.interval, 'changed': None, 'checked': None}
+            self._push(name, self.clock())
+
+    def remove(self, name:str):
+        '''
+        Stops checking a connection.
+        '''
+        with self._condition:
+            self._hosts.pop(name, None)
+
+    def request(self, names):
+        '''
+        Schedules the provided connections to be checked now, keeping their history.
+        '''
+        with self._condition:
+            for name in names:
+                if name in self._hosts:
+                    self._push(name, self.clock())
+
+    def pop_due(self):
+        '''
+        Returns a list of the names of connections which are due, in due order. They are not scheduled
+        again until their results are passed to report().
+        '''
+        now = self.clock()
+        names = []
+        with self._condition:
+            while self._heap and self._heap[0][0] <= now:
+                due, _, name = heapq.heappop(self._heap)
+                host = self._hosts.get(name)
+                if host is not None and host['due'] == due:
+                    host['due'] = None
+                    names.append(name)
+        return names
+
+    def next_due(self):
+        '''
+        Returns the clock() time the next connection is due, or None if nothing is scheduled.
+        '''
+        with self._condition:
+            while self._heap:
+                due, _, name = self._heap[0]
+                host = self._hosts.get(name)
+                if host is not None and host['due'] == due:
+                    return due
+                heapq.heappop(self._heap)
+        return None
+
+    def report(self, name:str, alive:bool):
+        '''
+        Records a connection's status and schedules its next check.
+        '''
+        with self._condition:
+            host = self._hosts.get(name)
+            if host is None:
+                return
+            now = self.clock()
+            if host['alive'] is not None and host['alive'] != alive:
+                host['changed'] = now
+                interval = self.recheck
+            elif host['changed'] is not None and now - host['changed'] < self.unstable_for:
+                interval = self.unstable_interval
+            else:
+                interval = min(self.max_up_interval if alive else self.max_interval, max(self.interval, host['interval'] * 2))
+            host['alive'] = alive
+            host['interval'] = interval
+            host['checked'] = now
+            self._push(name, now + interval * random.uniform(1 - self.jitter, 1 + self.jitter))
+
+    def age(self, name:str):
+        '''
+        Returns the seconds since a connection's status was last reported, or None if it never has been.
+        '''
+        with self._condition:
+            host = self._hosts.get(name)
+            if host is None or host['checked'] is None:
+                return None
+            return self.clock() - host['checked']
+
+    def wait(self, timeout:float=None, due:bool=True):
+        '''
+        Blocks until the next connection is due, wake() is called, or a connection is added or requested.
+
+        args:
+          timeout (float):  Maximum seconds to wait. (default None, no limit)
+          due (bool):  If False, don't return because a connection is due, e.g. while checks are paused. (default True)
+        '''
+        with self._condition:
+            due = self.next_due() if due else None
+            if due is not None:
+                delay = due - self.clock()
+                if delay <= 0:
+                    return
+                timeout = delay if timeout is None else min(timeout, delay)
+            self._condition.wait(timeout)
+
+    def wake(self):
+        '''
+        Wakes any thread blocked in wait().
+        '''
+        with self._condition:
+            self._condition.notify_all()
+
+class TokenBucket(object):
+    '''
+    Token-bucket rate limiter. Allows bursts of up to 'burst' events, refilled at 'rate' events per second.
+    '''
+    def __init__(self, rate:float, burst:int=None):
+        '''
+        args:
+          rate (float):  Number of tokens added per second.
+          burst (int):  Maximum number of tokens the bucket can hold. (default rate, at least 1)
+        '''
+        if rate <= 0:
+            raise ValueError('Rate must be greater than 0.')
+        self.rate = float(rate)
+        self.burst = burst or max(1, int(rate))
+        self._tokens = float(self.burst)
+        self._last = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def try_acquire(self):
+        '''
+        Takes a token if one is available. Returns True if a token was taken, otherwise returns False.
+        '''
+        self._refill()
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return True
+        return False
+
+    def delay(self):
+        '''
+        Returns the number of seconds until the next token is available.
+        '''
+        self._refill()
+        return max(0.0, (1 - self._tokens) / self.rate)
+
+    def acquire(self):
+        '''
+        Blocks until a token is available, then takes it.
+        '''
+        while not self.try_acquire():
+            time.sleep(self.delay())
+
+def _parse_target(item:str):
+    '''
+    Returns the (first, last) integer address range described by a single target expression.
+    '''
+    item = item.strip()
+    if '/' in item:
+        network = ipaddress.IPv4Network(item, strict=False)
+        first, last = int(network.network_address), int(network.broadcast_address)
+        if network.prefixlen < 31:
+            # Skip the network and broadcast addresses.
+            first, last = first + 1, last - 1
+        return (first, last)
+    if '-' in item:
+        start, end = [part.strip() for part in item.split('-', 1)]
+        first = int(ipaddress.IPv4Address(start))
+        if '.' not in end:
+            # Short form, e.g. 192.168.0.10-20.
+            end = '.'.join(start.split('.')[:-1] + [end])
+        last = int(ipaddress.IPv4Address(end))
+        if last < first:
+            raise ValueError(f'Invalid address range: {item}')
+        return (first, last)
+    address = int(ipaddress.IPv4Address(item))
+    return (address, address)
+
+def parse_targets(spec, exclude=None):
+    '''
+    Parses target expressions into a sorted list of disjoint (first, last) integer address ranges.\n
+    Raises ValueError if any expression is invalid.
+
+    args:
+      spec (str or iterable):  Target expressions, e.g. '10.20.0.0/16, 10.1.4.10-10.1.7.200, 192.168.0.5'.
+                               A string may separate expressions with commas or whitespace.
+      exclude (str or iterable):  Target expressions to remove from spec. (default None)
+    '''
+    def split(value):
+        if value is None:
+            return []
+        if isinstance(value, str):
+            value = value.replace(',', ' ').split()
+        return [_parse_target(item) for item in value if item.strip()]
+
+    ranges = []
+    for first, last in sorted(split(spec)):
+        if ranges and first <= ranges[-1][1] + 1:
+            ranges[-1] = (ranges[-1][0], max(ranges[-1][1], last))
+        else:
+            ranges.append((first, last))
+    for ex_first, ex_last in split(exclude):
+        remaining = []
+        for first, last in ranges:
+            if ex_last < first or ex_first > last:
+                remaining.append((first, last))
+                continue
+            if first < ex_first:
+                remaining.append((first, ex_first - 1))
+            if ex_last < last:
+                remaining.append((ex_last + 1, last))
+        ranges = remaining
+    return ranges
+
+def parse_ports(spec):
+    '''
+    Parses a port list into a sorted list of unique port numbers. Raises ValueError if it is invalid.
+
+    args:
+      spec (int, str or iterable):  A port, or port expressions such as '5900-5910, 5800'. A string may
+                                    separate expressions with commas or whitespace.
+    '''
+    if isinstance(spec, int):
+        spec = [str(spec)]
+    elif isinstance(spec, str):
+        spec = spec.replace(',', ' ').split()
+    ports = set()
+    for item in spec:
+        item = str(item).strip()
+        first, _, last = item.partition('-')
+        first, last = int(first), int(last or first)
+        if not 0 < first <= last <= 65535:
+            raise ValueError(f'Invalid port range: {item}')
+        ports.update(range(first, last + 1))
+    if not ports:
+        raise ValueError('No ports to scan.')
+    return sorted(ports)
+
+def parse_port(value):
+    '''
+    Returns a connection's VNC port as an int, 5900 if it is blank. Raises ValueError if it isn't a port number.
+
+    args:
+      value (str or int):  The port, e.g. a connection's 'vnc port'.
+    '''
+    value = str(value if value is not None else '').strip() or '5900'
+    if not value.isdigit() or not 0 < int(value) <= 65535:
+        raise ValueError(f'Invalid port: {value}')
+    return int(value)
+
+def display_number(port:int):
+    '''
+    Returns the VNC display number served on the provided port: N for 5900+N (VNC) or 5800+N (the
+    HTTP viewer port), otherwise None.
+    '''
+    for base in (5900, 5800):
+        if base <= port < base + 100:
+            return port - base
+    return None
+
+def count_targets(ranges:list):
+    '''
+    Returns the number of addresses in a list of ranges returned by parse_targets().
+    '''
+    return sum(last - first + 1 for first, last in ranges)
+
+def expand_targets(ranges:list, shuffle:bool=False):
+    '''
+    Generator.\n
+    Lazily yields each IP address string in a list of ranges returned by parse_targets(), without
+    building the full address list in memory.
+
+    args:
+      ranges (list):  (first, last) integer address ranges.
+      shuffle (bool):  If True, yield the addresses in a pseudo-random order. (default False)
+    '''
+    total = count_targets(ranges)
+    if not shuffle:
+        for first, last in ranges:
+            for address in range(first, last + 1):
+                yield str(ipaddress.IPv4Address(address))
+        return
+
+    # Walk the index space with an affine permutation, i -> (a*i + b) mod total, where a is coprime with total.
+    offsets = []
+    running = 0
+    for first, last in ranges:
+        offsets.append(running)
+        running += last - first + 1
+    step = random.randrange(1, max(2, total)) | 1
+    while total > 1 and math.gcd(step, total) != 1:
+        step += 2
+    start = random.randrange(max(1, total))
+    for i in range(total):
+        index = (step * i + start) % total
+        r = bisect.bisect_right(offsets, index) - 1
+        yield str(ipaddress.IPv4Address(ranges[r][0] + index - offsets[r]))
+
+def _in_ranges(ranges:list, address:int):
+    i = bisect.bisect_right(ranges, (address, math.inf)) - 1
+    return i >= 0 and ranges[i][0] <= address <= ranges[i][1]
+
+def parse_proc_arp(text:str):
+    '''
+    Returns the set of IPv4 addresses with a completed entry in the text of a /proc/net/arp file.
+    '''
+    neighbors = set()
+    for line in text.splitlines()[1:]:
+        fields = line.split()
+        # IP address, HW type, Flags, HW address, Mask, Device. Flag 0x2 marks a completed entry.
+        if len(fields) < 4 or fields[3] == '00:00:00:00:00:00':
+            continue
+        try:
+            if int(fields[2], 16) & 0x2:
+                neighbors.add(str(ipaddress.IPv4Address(fields[0])))
+        except ValueError:
+            continue
+    return neighbors
+
+def parse_ip_neigh(text:str):
+    '''
+    Returns the set of IPv4 addresses with a link layer address, and not FAILED or INCOMPLETE, in the
+    output of 'ip neigh show'.
+    '''
+    neighbors = set()
+    for line in text.splitlines():
+        fields = line.split()
+        if 'lladdr' not in fields or fields[-1] in ('FAILED', 'INCOMPLETE'):
+            continue
+        try:
+            neighbors.add(str(ipaddress.IPv4Address(fields[0])))
+        except ValueError:
+            continue
+    return neighbors
+
+def parse_arp_a(text:str):
     '''
-    s = socket.socket(socket.AF_INET,socket.SOCK_STREAM)
-    s.settimeout(0.1)
-    result = None
+    Returns the set of IPv4 addresses with a unicast 'dynamic' or 'static' entry in the output of
+    Windows 'arp -a'.
+    '''
+    neighbors = set()
+    for line in text.splitlines():
+        fields = line.split()
+        if len(fields) != 3 or fields[2] not in ('dynamic', 'static') or fields[1].lower() == 'ff-ff-ff-ff-ff-ff':
+            continue
+        try:
+            if not ipaddress.IPv4Address(fields[0]).is_multicast:
+                neighbors.add(fields[0])
+        except ValueError:
+            continue
+    return neighbors
+
+def read_neighbor_table(file:str=NEIGHBOR_TABLE_FILE):
+    '''
+    Returns the set of IPv4 addresses the operating system's neighbor (ARP) table has seen answer
+    recently. Reads the provided file in /proc/net/arp format if it exists, otherwise runs
+    'ip neigh show' or 'arp -a'. Returns an empty set if none of these are available.
+
+    Only hosts on the local network segment appear in the table.
+
+    args:
+      file (str):  The /proc/net/arp format file to read. (default NEIGHBOR_TABLE_FILE)
+    '''
+    if file and pathlib.Path(file).is_file():
+        with open(file) as f:
+            return parse_proc_arp(f.read())
+    for command, parser in ((['ip', '-4', 'neigh', 'show'], parse_ip_neigh), (['arp', '-a'], parse_arp_a)):
+        try:
+            output = subprocess.run(command, capture_output=True, text=True, timeout=2,
+                                    creationflags=getattr(subprocess, 'CREATE_NO_WINDOW', 0)).stdout
+        except (OSError, subprocess.SubprocessError):
+            continue
+        return parser(output)
+    return set()
+
+def known_neighbors(ranges:list, neighbor_table=None):
+    '''
+    Returns a sorted list of the addresses in a list of ranges returned by parse_targets() which are in the
+    neighbor table.
+
+    args:
+      ranges (list):  (first, last) integer address ranges.
+      neighbor_table (iterable):  Addresses known to be present. (default read_neighbor_table())
+    '''
+    if neighbor_table is None:
+        neighbor_table = read_neighbor_table()
+    known = {int(ipaddress.IPv4Address(address)) for address in neighbor_table}
+    return [str(ipaddress.IPv4Address(address)) for address in sorted(known) if _in_ranges(ranges, address)]
+
+def order_by_neighbors(ranges:list, mode:str='first', shuffle:bool=False, neighbor_table=None):
+    '''
+    Generator.
+
+    Yields the addresses in a list of ranges returned by parse_targets(), starting with those in the
+    neighbor table. The remaining addresses follow in expand_targets() order if mode is 'first', or are
+    skipped if mode is 'only'.
+
+    args:
+      ranges (list):  (first, last) integer address ranges.
+      mode (str):  'first' or 'only'. (default 'first')
+      shuffle (bool):  If True, the remaining addresses are yielded in a pseudo-random order. (default False)
+      neighbor_table (iterable):  Addresses known to be present. (default read_neighbor_table())
+    '''
+    if mode not in NEIGHBOR_MODES:
+        raise ValueError(f'Invalid neighbor mode: {mode}')
+    known = known_neighbors(ranges, neighbor_table)
+    yield from known
+    if mode == 'only':
+        return
+    known = set(known)
+    for address in expand_targets(ranges, shuffle):
+        if address not in known:
+            yield address
+
+class RttEstimator(object):
+    '''
+    Tracks each host's connect round trip time (RTT) and derives its probe timeout from it, in the
+    same way as TCP's retransmission timer: a smoothed RTT plus four times its mean deviation, kept
+    between min_timeout and max_timeout. Hosts with no measurements use first_timeout.\n
+    When a host which has answered before times out, its timeout is doubled until it answers again,
+    so hosts behind slow links aren't marked dead. A known host which has never answered in time (e.g.
+    a saved connection over a VPN with a round trip above first_timeout) can be given one probe at
+    max_timeout, at most once every escalate_interval seconds, see timed_out().
+    '''
+    ALPHA = 0.125  # Weight of a new sample in the smoothed RTT.
+    BETA = 0.25  # Weight of a new sample in the RTT deviation.
+
+    def __init__(self, first_timeout:float=SCAN_TIMEOUT, min_timeout:float=MIN_PROBE_TIMEOUT, max_timeout:float=MAX_PROBE_TIMEOUT,
+                 max_hosts:int=65536, escalate_interval:float=900):
+        '''
+        args:
+          first_timeout (float):  Timeout for hosts with no measured RTT.
+          min_timeout (float):  Lower bound for any timeout.
+          max_timeout (float):  Upper bound for any timeout.
+          max_hosts (int):  Maximum number of hosts tracked. Least recently used hosts are dropped first.
+          escalate_interval (float):  Minimum seconds between probes at max_timeout of a host with no measured RTT.
+        '''
+        self.first_timeout = first_timeout
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.max_hosts = max_hosts
+        self.escalate_interval = escalate_interval
+        # address -> [smoothed rtt, rtt deviation, backoff multiplier]. Until a host is measured, its smoothed
+        # rtt is None and the deviation slot holds the time.monotonic() value it was last escalated.
+        self._hosts = OrderedDict()
+        self._lock = threading.Lock()
+
+    def timeout(self, address:str):
+        '''
+        Returns the probe timeout, in seconds, for the provided address.
+        '''
+        with self._lock:
+            host = self._hosts.get(address)
+        if host is None:
+            return self.first_timeout
+        srtt, rttvar, backoff = host
+        if srtt is None:
+            return min(self.max_timeout, self.first_timeout * backoff)
+        return min(self.max_timeout, max(self.min_timeout, srtt + 4 * rttvar) * backoff)
+
+    def sample(self, address:str, rtt:float):
+        '''
+        Records a measured connect round trip time, in seconds, for the provided address.
+        '''
+        with self._lock:
+            host = self._hosts.get(address)
+            if host is None or host[0] is None:
+                self._hosts[address] = [rtt, rtt / 2, 1]
+                self._hosts.move_to_end(address)
+                while len(self._hosts) > self.max_hosts:
+                    self._hosts.popitem(last=False)
+            else:
+                host[1] = (1 - self.BETA) * host[1] + self.BETA * abs(host[0] - rtt)
+                host[0] = (1 - self.ALPHA) * host[0] + self.ALPHA * rtt
+                host[2] = 1
+                self._hosts.move_to_end(address)
+
+    def measured(self, address:str):
+        '''
+        Returns True if a round trip time has been measured for the provided address.
+        '''
+        with self._lock:
+            host = self._hosts.get(address)
+            return host is not None and host[0] is not None
+
+    def timed_out(self, address:str, escalate:bool=False):
+        '''
+        Records that a probe of the provided address timed out. Hosts with a measured RTT back off.
+        Addresses which have never answered keep first_timeout, so scans of empty ranges stay fast. If
+        escalate is True, such an address gets max_timeout for its next probe, unless it had it within the
+        last escalate_interval seconds. If that probe times out too it goes back to first_timeout, so a host
+        which drops probes only costs max_timeout once per escalate_interval.
+
+        args:
+          address (str):  The IP address.
+          escalate (bool):  If True, raise the timeout of an address with no measured RTT. (default False)
+        '''
+        with self._lock:
+            host = self._hosts.get(address)
+            if host is None or host[0] is None:
+                if not escalate:
+                    return
+                now = time.monotonic()
+                if host is not None and host[2] > 1:
+                    host[2] = 1  # The probe at max_timeout wasn't answered either.
+                elif host is None or now - host[1] >= self.escalate_interval:
+                    self._hosts[address] = [None, now, self.max_timeout / self.first_timeout]
+                    self._hosts.move_to_end(address)
+                    while len(self._hosts) > self.max_hosts:
+                        self._hosts.popitem(last=False)
+            elif min(host[0] + 4 * host[1], self.max_timeout) * host[2] < self.max_timeout:
+                host[2] *= 2
+
+
+rtt_estimator = RttEstimator()
+
+MAX_FINGERPRINTS = 65536
+_fingerprints = OrderedDict()  # (address, port) -> fingerprint dict from the last successful RFB handshake, least recent first.
+_fingerprints_lock = threading.Lock()
+
+def _record_fingerprint(address:str, port:int, fingerprint:dict):
+    with _fingerprints_lock:
+        _fingerprints[(address, port)] = fingerprint
+        _fingerprints.move_to_end((address, port))
+        while len(_fingerprints) > MAX_FINGERPRINTS:
+            _fingerprints.popitem(last=False)
+
+def get_fingerprint(address:str, port:int=5900):
+    '''
+    Returns the fingerprint recorded by the last successful RFB handshake probe of the provided address
+    and port, as a {'rfb version': str, 'security types': list, 'auth': list} dictionary, or None if
+    there isn't one.
+
+    args:
+      address (str):  IP address of the target PC.
+      port (int):  Port which the Tight VNC service is broadcasting.
+    '''
+    with _fingerprints_lock:
+        return _fingerprints.get((address, port))
+
+def _read_rfb(probe:dict):
+    '''
+    Advances an RFB handshake probe using the bytes received so far.\n
+    Returns None if more bytes are needed, otherwise a (alive, fingerprint) tuple.
+    '''
+    buffer = probe['buffer']
+    if probe['state'] == 'banner':
+        if len(buffer) < len(RFB_BANNER):
+            return None if RFB_BANNER.startswith(buffer[:4]) else (False, None)
+        banner = buffer[:len(RFB_BANNER)]
+        try:
+            if not banner.startswith(b'RFB ') or banner[7:8] != b'.' or banner[11:12] != b'\n':
+                raise ValueError
+            major, minor = int(banner[4:7]), int(banner[8:11])
+        except ValueError:
+            return (False, None)
+        # Reply with the highest version both sides support, as a viewer would.
+        probe['version'] = (3, 8) if (major, minor) >= (3, 8) else (3, 7) if (major, minor) >= (3, 7) else (3, 3)
+        probe['socket'].send(b'RFB 003.%03d\n' % probe['version'][1])
+        probe['state'] = 'security'
+        probe['buffer'] = buffer = buffer[len(RFB_BANNER):]
+        probe['rfb version'] = f'{major}.{minor}'
+    if probe['version'] == (3, 3):
+        # The server chooses a single security type.
+        if len(buffer) < 4:
+            return None
+        types = [int.from_bytes(buffer[:4], 'big')]
+    else:
+        if len(buffer) < 1 or len(buffer) < 1 + buffer[0]:
+            return None
+        types = list(buffer[1:1 + buffer[0]])
+    types = [t for t in types if t != 0]  # 0 means the server refused the connection.
+    return (True, {'rfb version': probe['rfb version'], 'security types': types,
+                   'auth': [RFB_SECURITY_TYPES.get(t, f'Unknown ({t})') for t in types]})
+
+def probe_many(targets, timeout:float=None, max_concurrency:int=SCAN_CONCURRENCY, rate_limiter:TokenBucket=None,
+               handshake:bool=False, handshake_timeout:float=HANDSHAKE_TIMEOUT, escalate:bool=False):
+    '''
+    Generator.\n
+    Probes many (address, port) targets concurrently using non-blocking sockets and a selector.\n
+    Yields an (address, port, alive, fingerprint) tuple for each target, in the order the probes complete.
+    fingerprint is None unless handshake is True and the target answered as a VNC server.
+
+    args:
+      targets (iterable):  (address, port) tuples to probe. Consumed lazily, as probe slots free up.
+      timeout (float):  Seconds to wait for each connection before it is considered dead. If None, each
+                        target's timeout comes from rtt_estimator, which also records the connect times
+                        measured here. (default None)
+      max_concurrency (int):  Maximum number of connections in flight at once.
+      rate_limiter (TokenBucket):  If provided, limits the rate at which new connections are started. (default None)
+      handshake (bool):  If True, a target is only alive if it sends an RFB banner. Its protocol version and
+                         security types are read over the same connection, returned as the fingerprint and
+                         recorded for get_fingerprint(). (default False)
+      handshake_timeout (float):  Seconds to wait for the RFB banner and security types once connected.
+      escalate (bool):  If True, targets which have never answered get max_timeout after timing out, see
+                        RttEstimator.timed_out(). Used for saved connections, not scan sweeps. (default False)
+    '''
+    targets = iter(targets)
+    selector = selectors.DefaultSelector()
+    in_flight = {}  # socket -> probe dict.
+    exhausted = False
+
+    def finish(s, alive, fingerprint=None, timed_out=False):
+        probe = in_flight.pop(s)
+        selector.unregister(s)
+        s.close()
+        if Metrics.enabled:
+            PROBES.inc(result='alive' if alive else 'timeout' if timed_out else 'closed')
+            PROBE_SECONDS.observe(time.monotonic() - probe['started'])
+        if 'trace start' in probe:
+            Tracing.overlapping('probe', 'probe', f"{probe['address']}:{probe['port']}", probe['trace start'],
+                                {'address': probe['address'], 'port': probe['port'], 'alive': alive, 'timed out': timed_out})
+        if fingerprint is not None:
+            _record_fingerprint(probe['address'], probe['port'], fingerprint)
+        return (probe['address'], probe['port'], alive, fingerprint)
+
     try:
-        result = s.connect_ex((address,port))
-    except socket.error as e:
-        pass
+        while True:
+            # Top up the in-flight probes until the concurrency cap or the rate limit is reached.
+            throttled = False
+            while not exhausted and len(in_flight) < max_concurrency:
+                if rate_limiter is not None and not rate_limiter.try_acquire():
+                    throttled = True
+                    break
+                try:
+                    address, port = next(targets)
+                except StopIteration:
+                    exhausted = True
+                    break
+                s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                s.setblocking(False)
+                started = time.monotonic()
+                try:
+                    result = s.connect_ex((address, port))
+                except socket.error:
+                    result = errno.EHOSTUNREACH
+                if result in (errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EALREADY):
+                    selector.register(s, selectors.EVENT_WRITE)
+                    probe_timeout = timeout if timeout is not None else rtt_estimator.timeout(address)
+                    in_flight[s] = {'socket': s, 'address': address, 'port': port, 'started': started,
+                                    'deadline': started + probe_timeout, 'state': 'connect', 'buffer': b''}
+                    if Tracing.enabled:
+                        in_flight[s]['trace start'] = Tracing.now()
+                elif result == 0 and handshake:
+                    # Connected straight away (e.g. over loopback), so go on to read the banner.
+                    selector.register(s, selectors.EVENT_READ)
+                    in_flight[s] = {'socket': s, 'address': address, 'port': port, 'started': started,
+                                    'deadline': started + handshake_timeout, 'state': 'banner', 'buffer': b''}
+                    if Tracing.enabled:
+                        in_flight[s]['trace start'] = Tracing.now()
+                else:
+                    s.close()
+                    if Metrics.enabled:
+                        PROBES.inc(result='alive' if result == 0 and not handshake else 'closed')
+                    yield (address, port, result == 0 and not handshake, None)
+            if not in_flight:
+                if exhausted:
+                    break
+                if throttled:
+                    time.sleep(rate_limiter.delay())
+                continue
+
+            # Wait for connections to progress, up to the earliest deadline or the next rate limiter token.
+            wait = max(0, min(probe['deadline'] for probe in in_flight.values()) - time.monotonic())
+            if throttled:
+                wait = min(wait, rate_limiter.delay())
+            for key, _ in selector.select(wait):
+                s = key.fileobj
+                probe = in_flight[s]
+                if probe['state'] == 'connect':
+                    error = s.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+                    if timeout is None and error in (0, errno.ECONNREFUSED):
+                        # Both a completed connection and a reset are a full round trip to the host.
+                        rtt_estimator.sample(probe['address'], time.monotonic() - probe['started'])
+                    if error != 0:
+                        yield finish(s, False)
+                    elif not handshake:
+                        yield finish(s, True)
+                    else:
+                        probe['state'] = 'banner'
+                        probe['deadline'] = time.monotonic() + handshake_timeout
+                        selector.modify(s, selectors.EVENT_READ)
+                    continue
+                try:
+                    data = s.recv(256)
+                except socket.error:
+                    data = b''
+                if not data:
+                    yield finish(s, False)
+                    continue
+                probe['buffer'] += data
+                try:
+                    result = _read_rfb(probe)
+                except socket.error:
+                    result = (False, None)
+                if result is not None:
+                    yield finish(s, *result)
+
+            # Expire any probes which have run out of time.
+            now = time.monotonic()
+            for s in [s for s, probe in in_flight.items() if probe['deadline'] <= now]:
+                if timeout is None and in_flight[s]['state'] == 'connect':
+                    rtt_estimator.timed_out(in_flight[s]['address'], escalate)
+                yield finish(s, False, timed_out=True)
     finally:
-        s.close()
-    if result == 0:
-        # connection is alive.
-        return True
-    else:
-        return False
+        for s in in_flight:
+            selector.unregister(s)
+            s.close()
+        selector.close()
+
+def _as_ranges(targets, exclude=None):
+    '''
+    Returns targets as a list of ranges, parsing them with parse_targets() unless they already are.
+    '''
+    if isinstance(targets, list) and all(isinstance(t, tuple) for t in targets):
+        return targets
+    return parse_targets(targets, exclude)
 
-def scan(address:str=get_this_pc_info()['ip'], port:int=5900, address_range:tuple=(2, 255)):
+def scan(address:str=None, port=5900, address_range:tuple=(2, 255), max_concurrency:int=SCAN_CONCURRENCY,
+         targets=None, exclude=None, shuffle:bool=False, rate:float=None, resolver:Resolvers.ReverseResolver=None,
+         handshake:bool=False, neighbors:str=None, neighbor_table=None, addresses=None):
     '''
     Generator.\n
     Scans the LAN for any PCs running a Tight VNC server (on default port 5900).\n
-    Yields a {'name': str, 'ip': str, 'port': int, 'alive': bool} dictionary for each PC running a Tight VNC server.
+    Yields a {'name': str, 'ip': str, 'port': int, 'display': int, 'alive': bool} dictionary for each address
+    and port scanned, in the order the probes complete. display is the VNC display number of the port (see
+    display_number()). All of an address's ports are probed concurrently, and each open port is yielded
+    separately. Names of live hosts are looked up once per address on the resolver's own pool, so a live
+    port is yielded once its host's name is known ('' if it has none).\n
+    With handshake enabled, each dictionary also has 'rfb version' (str, '' if unknown) and 'auth'
+    (list of security type names) keys.
 
     args:
-      address (str):  An IP address that is on the network you'd like to scan. Default to host machine ip.
-      port (int):  Port which the Tight VNC service is broadcasting.
+      address (str):  An IP address that is on the network you'd like to scan. (default host machine ip)
+      port (int, str or iterable):  Port(s) which the Tight VNC service is broadcasting, e.g. 5900 or
+                                    '5900-5910, 5800'. See parse_ports().
       address_range (tuple):  The address range to scan. e.g., (100, 120) results in the range 
-                              of 192.168.0.100 to 192.168.0.119.
+                              of 192.168.0.100 to 192.168.0.120.
+      max_concurrency (int):  Maximum number of addresses probed at once.
+      targets (str, iterable or list):  Target expressions (see parse_targets()), or ranges already returned by
+                                        parse_targets(). Overrides address and address_range. (default None)
+      exclude (str or iterable):  Target expressions to skip. Only used with targets. (default None)
+      shuffle (bool):  If True, scan the addresses in a pseudo-random order. (default False)
+      rate (float):  Maximum number of probes started per second. (default None, unlimited)
+      resolver (ReverseResolver):  Resolver used to name live hosts. (default Resolvers.reverse_resolver)
+      handshake (bool):  If True, only servers which send an RFB banner are alive. See probe_many(). (default False)
+      neighbors (str):  If 'first', addresses in the neighbor (ARP) table are probed before the rest. If 'only',
+                        no other addresses are probed. See order_by_neighbors(). (default None, scan in order)
+      neighbor_table (iterable):  Addresses known to be present, used with neighbors. (default read_neighbor_table())
+      addresses (iterable):  IP address strings to scan, in this order. Overrides all the other address options. (default None)
     '''
+    if addresses is None:
+        if targets is None:
+            address = address or get_this_pc_info()['ip']
+            network = '.'.join(address.split('.')[0:-1])
+            network += '.'
+            ranges = parse_targets(f'{network}{address_range[0]}-{network}{address_range[1]}')
+        else:
+            ranges = _as_ranges(targets, exclude)
+        if neighbors:
+            addresses = order_by_neighbors(ranges, neighbors, shuffle, neighbor_table)
+        else:
+            addresses = expand_targets(ranges, shuffle)
+    ports = parse_ports(port)
+    resolver = resolver or Resolvers.reverse_resolver
+    rate_limiter = TokenBucket(rate) if rate else None
+    probes = ((address_to_scan, port_to_scan) for address_to_scan in addresses for port_to_scan in ports)
+    def record(name, ip, port, alive, fingerprint):
+        item = {'name':name, 'ip':ip, 'port':port, 'display': display_number(port), 'alive': alive}
+        if handshake:
+            item['rfb version'] = fingerprint['rfb version'] if fingerprint else ''
+            item['auth'] = fingerprint['auth'] if fingerprint else []
+        return item
 
-    socket.setdefaulttimeout(0.25)
-    network = '.'.join(address.split('.')[0:-1])
-    network += '.'
-    for i in range(address_range[0], address_range[1]+1):
-        name = ''
-        address_to_scan = network + str(i)
-        alive = False
-        if is_alive(address_to_scan, port):
-            try:
-                name = socket.gethostbyaddr(address_to_scan)[0]
-                alive = True
-            except Exception as e:
-                raise e
-        yield {'name':name, 'ip':address_to_scan, 'port':port, 'alive': alive}
+    lookups = {}  # ip -> Future, so an address with several open ports is only looked up once.
+    naming = []  # (Future, ip, port, fingerprint) for live ports waiting on a reverse lookup.
+    started = time.perf_counter()
+    with Tracing.span('scan', 'scan', ports=len(ports), handshake=handshake):
+        for address_to_scan, port, alive, fingerprint in probe_many(probes, None, max_concurrency, rate_limiter, handshake):
+            if Metrics.enabled:
+                SCAN_ADDRESSES.inc(alive=str(alive).lower())
+            if alive:
+                if address_to_scan not in lookups:
+                    lookups[address_to_scan] = resolver.lookup_async(address_to_scan)
+                naming.append((lookups[address_to_scan], address_to_scan, port, fingerprint))
+            else:
+                yield record('', address_to_scan, port, False, None)
+            if naming:
+                waiting = []
+                for future, ip, live_port, live_fingerprint in naming:
+                    if future.done():
+                        yield record(future.result(), ip, live_port, True, live_fingerprint)
+                    else:
+                        waiting.append((future, ip, live_port, live_fingerprint))
+                naming = waiting
+        for future, ip, live_port, live_fingerprint in naming:
+            yield record(future.result(), ip, live_port, True, live_fingerprint)
+    if Metrics.enabled:
+        SCANS.inc()
+        SCAN_SECONDS.observe(time.perf_counter() - started)
+
+def incremental_scan(targets, port=5900, exclude=None, cache:Storage.ScanResultCache=None, skip_empty_for:float=None,
+                     shuffle:bool=False, neighbors:str=None, neighbor_table=None, **kwargs):
+    '''
+    Generator.\n
+    Rescans targets using the results of earlier scans, kept in a Storage.ScanResultCache. Addresses and ports
+    which were alive are probed first, so hosts which have gone or been renamed are found early. Addresses
+    where every port was confirmed empty within the last skip_empty_for seconds are skipped. All other
+    addresses follow in their usual order.\n
+    Yields the scan() dictionary for each address and port probed, with a 'change' key: 'new' if it is alive
+    and wasn't before, 'gone' if it was alive and isn't now, 'renamed' if its name changed (the previous
+    name is under 'old name'), otherwise ''. The results are written back to the cache as the scan runs,
+    and empty results older than the 'scan cache minutes' setting are pruned when it ends.
+
+    args:
+      targets (str, iterable or list):  Target expressions, or ranges already returned by parse_targets().
+      port (int, str or iterable):  Port(s) to probe. See parse_ports().
+      exclude (str or iterable):  Target expressions to skip. (default None)
+      cache (ScanResultCache):  The scan result cache. (default get_scan_cache())
+      skip_empty_for (float):  Seconds an empty address is skipped for. (default the 'scan cache minutes' setting)
+      shuffle (bool):  If True, addresses which weren't alive are probed in a pseudo-random order. (default False)
+      neighbors (str):  'first' or 'only', to order the addresses which weren't alive by the neighbor table.
+                        See order_by_neighbors(). (default None)
+      neighbor_table (iterable):  Addresses known to be present, used with neighbors. (default read_neighbor_table())
+      **kwargs:  Other scan() arguments, e.g. rate, max_concurrency, resolver and handshake.
+    '''
+    ranges = _as_ranges(targets, exclude)
+    ports = parse_ports(port)
+    cache = cache or get_scan_cache()
+    keep_empty_for = get_settings_from_file()['scan cache minutes'] * 60
+    if skip_empty_for is None:
+        skip_empty_for = keep_empty_for
+    # Only live results are held in memory. Empty ones are looked up one address at a time.
+    previous = {key: result for key, result in cache.lookup(ranges, alive_only=True) if key[1] in ports}
+    fresh = time.time() - skip_empty_for
+    was_alive = sorted({ip for ip, port_checked in previous}, key=lambda ip: int(ipaddress.IPv4Address(ip)))
+
+    def order():
+        yield from was_alive
+        skip = set(was_alive)
+        if neighbors:
+            addresses = order_by_neighbors(ranges, neighbors, shuffle, neighbor_table)
+        else:
+            addresses = expand_targets(ranges, shuffle)
+        for address in addresses:
+            if address in skip:
+                continue
+            if skip_empty_for > 0 and cache.empty_since(address, ports, fresh):
+                continue
+            yield address
+
+    pending = []
+    try:
+        for item in scan(port=ports, addresses=order(), **kwargs):
+            before = previous.get((item['ip'], item['port']))
+            if item['alive'] and (before is None or not before['alive']):
+                item['change'] = 'new'
+            elif item['alive'] and before['name'] != item['name']:
+                item['change'] = 'renamed'
+                item['old name'] = before['name']
+            elif not item['alive'] and before is not None and before['alive']:
+                item['change'] = 'gone'
+            else:
+                item['change'] = ''
+            pending.append(item)
+            if len(pending) >= 500:
+                cache.record_many(pending)
+                pending = []
+            yield item
+    finally:
+        if pending:
+            cache.record_many(pending)
+        cache.prune(max(keep_empty_for, skip_empty_for))
+
+_databases = {}
 
+def get_connection_database(file:str=DATA_FILE):
+    '''
+    Returns the shared Storage.ConnectionDatabase for the provided file, opening it (and migrating
+    connections from the old pickled connections file) on first use.
+
+    args:
+      file (str):  The database file path and name.
+    '''
+    if file not in _databases:
+        _databases[file] = Storage.ConnectionDatabase(file)
+    return _databases[file]
+
+_stores = {}
+
+def get_connection_store(file:str=DATA_FILE):
+    '''
+    Returns the process-wide Storage.ConnectionStore for the provided database file, loading it on
+    first use. The App and all Toplevels share this object.
+
+    args:
+      file (str):  The database file path and name.
+    '''
+    if file not in _stores:
+        _stores[file] = Storage.ConnectionStore(get_connection_database(file))
+    return _stores[file]
+
+_scan_caches = {}
+
+def get_scan_cache(file:str=Storage.SCAN_CACHE_FILE):
+    '''
+    Returns the shared Storage.ScanResultCache for the provided database file, opening it on first use.
+
+    args:
+      file (str):  The database file path and name.
+    '''
+    if file not in _scan_caches:
+        _scan_caches[file] = Storage.ScanResultCache(file)
+    return _scan_caches[file]
+
+@Tracing.traced('get connections from file', 'storage')
 def get_connections_from_file(file:str=DATA_FILE):
     '''
     Returns connections dict from the provided file.
@@ -100,40 +1210,37 @@ def get_connections_from_file(file:str=DATA_FILE):
     args:
       file (str):  The file path and name. 
     '''
-    if not pathlib.Path(file).is_file():
-        with open(file, 'wb') as f:
-            pickle.dump({}, f)
-    with open(file, 'rb') as f:
-        data = pickle.load(f)
-    for key in data.keys():
-        data[key]['is alive'] = False
-    return data
+    return get_connection_database(file).all()
 
+@Tracing.traced('save connections to file', 'storage')
 def save_connections_to_file(data:dict, file:str=DATA_FILE):
     '''
-    Saves the provided connections to the provided file.
+    Saves the provided connections to the provided file. Only connections which were added, changed
+    or removed are written.
 
     args:
       data (dict):  The connections dict to save.
       file (str):  The file path and name to save the data to.
     '''
-    with open(file, 'wb') as f:
-        pickle.dump(data, f)
+    get_connection_database(file).replace_all(data)
 
+@Metrics.timed(Storage.STORAGE_SECONDS, operation='load_settings')
 def get_settings_from_file(file:str=SETTINGS_FILE):
     '''
-    Returns settings dict from the provided file.
+    Returns settings dict from the provided file. Settings missing from the file are filled in
+    from DEFAULT_SETTINGS.
 
     args:
       file (str):  The file path and name. 
     '''
     if not pathlib.Path(file).is_file():
         with open(file, 'wb') as f:
-            pickle.dump({'enable scan':1, 'enable close':0}, f)
+            pickle.dump(DEFAULT_SETTINGS, f)
     with open(file, 'rb') as f:
         data = pickle.load(f)
-    return data
+    return {**DEFAULT_SETTINGS, **data}
 
+@Metrics.timed(Storage.STORAGE_SECONDS, operation='save_settings')
 def save_settings_to_file(data:dict, file:str=SETTINGS_FILE):
     '''
     Saves the provided settings to the provided file.
@@ -0,0 +1,701 @@
+'''
+SQLite storage for the VNC selector's known connections and network scan results.
+'''
+
+import os
+import sqlite3
+import pathlib
+import pickle
+import threading
+import contextlib
+import time
+import ipaddress
+from collections import defaultdict
+from collections.abc import Mapping
+import resources.Metrics as Metrics
+import resources.Tracing as Tracing
+
+DATABASE_FILE = os.path.join('resources', 'connections.db')
+LEGACY_DATA_FILE = os.path.join('resources', 'connections.dat')
+SCAN_CACHE_FILE = os.path.join('resources', 'scan_cache.db')  # Kept apart so scans don't look like connection changes to other instances.
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS connections (
+    name TEXT PRIMARY KEY,
+    hostname TEXT NOT NULL DEFAULT '',
+    ip_address TEXT NOT NULL DEFAULT '',
+    vnc_password TEXT NOT NULL DEFAULT '',
+    vnc_port TEXT NOT NULL DEFAULT '5900',
+    revision INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS deleted_connections (
+    name TEXT PRIMARY KEY,
+    revision INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS connections_hostname ON connections (hostname);
+CREATE INDEX IF NOT EXISTS connections_ip_address ON connections (ip_address);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+'''
+_COLUMNS = 'name, hostname, ip_address, vnc_password, vnc_port'
+_INSERT = f'INSERT INTO connections ({_COLUMNS}, revision) VALUES (?, ?, ?, ?, ?, ?)'
+_SYNC_EVENT_LIMIT = 100  # Above this many merged changes, subscribers get a single 'load' event.
+
+STORAGE_SECONDS = Metrics.Histogram('vnc_selector_storage_seconds', 'Time taken by connection and settings file reads and writes, by operation.')
+
+
+def _to_row(name:str, connection:dict):
+    return (name, connection.get('hostname', ''), connection.get('ip address', ''),
+            connection.get('vnc password', ''), str(connection.get('vnc port', '5900')))
+
+def _from_row(row):
+    return row[0], {
+        'hostname': row[1],
+        'ip address': row[2],
+        'vnc password': row[3],
+        'vnc port': row[4],
+        'is alive': False}
+
+
+class ConflictError(KeyError):
+    '''
+    Raised when saving a change to a connection which another instance has changed or deleted since it
+    was loaded.
+    '''
+
+
+class ConnectionDatabase(object):
+    '''
+    Stores known connections in an SQLite database, with per-record insert, update and delete, and
+    indexes on name, hostname and IP address. Connections are the same dicts used throughout the app:
+    {'hostname': str, 'ip address': str, 'vnc password': str, 'vnc port': str, 'is alive': bool}.
+    'is alive' is not stored.\n
+    Every write transaction takes the next database revision number, which is stored with each row it
+    writes and each name it deletes, so instances sharing the file can fetch just the changes made
+    since they last looked (see changes_since()) and detect conflicting edits.
+    '''
+    def __init__(self, file:str=DATABASE_FILE, legacy_file:str=LEGACY_DATA_FILE):
+        '''
+        args:
+          file (str):  The database file path and name.
+          legacy_file (str):  Pickled connections file which is imported, once, when the database is created.
+        '''
+        self.file = file
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(file, check_same_thread=False)
+        self._db.executescript(_SCHEMA)
+        self._upgrade()
+        self._migrate(legacy_file)
+
+    def _upgrade(self):
+        '''
+        Adds the revision column to databases created before it existed.
+        '''
+        with self._lock, self._db:
+            if 'revision' not in [row[1] for row in self._db.execute('PRAGMA table_info(connections)')]:
+                self._db.execute('ALTER TABLE connections ADD COLUMN revision INTEGER NOT NULL DEFAULT 0')
+            self._db.execute('CREATE INDEX IF NOT EXISTS connections_revision ON connections (revision)')
+            self._db.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('revision', 0)")
+            self._db.execute('DROP TABLE IF EXISTS scan_results')  # Moved to SCAN_CACHE_FILE.
+
+    def _next_revision(self):
+        '''
+        Returns a new revision number. Must be called inside a write transaction, before any other write,
+        so that the number is only used once the transaction commits.
+        '''
+        self._db.execute("UPDATE meta SET value = value + 1 WHERE key = 'revision'")
+        return int(self._db.execute("SELECT value FROM meta WHERE key = 'revision'").fetchone()[0])
+
+    @contextlib.contextmanager
+    def busy_timeout(self, seconds:float):
+        '''
+        Context manager which holds the database lock and, inside its block, makes statements wait at most
+        the provided seconds for another connection's lock on the file before raising sqlite3.OperationalError.
+        '''
+        with self._lock:
+            previous = self._db.execute('PRAGMA busy_timeout').fetchone()[0]
+            self._db.execute(f'PRAGMA busy_timeout = {int(seconds * 1000)}')
+            try:
+                yield
+            finally:
+                self._db.execute(f'PRAGMA busy_timeout = {int(previous)}')
+
+    def data_version(self):
+        '''
+        Returns a number which changes whenever another connection to the database file, in this or any
+        other process, commits a change. It is cheap enough to poll often.
+        '''
+        with self._lock:
+            return self._db.execute('PRAGMA data_version').fetchone()[0]
+
+    @Metrics.timed(STORAGE_SECONDS, operation='changes_since')
+    @Tracing.traced('ConnectionDatabase.changes_since', 'storage')
+    def changes_since(self, revision:int):
+        '''
+        Returns the changes made after the provided revision as (current revision, changed, deleted), where
+        changed is a dict of name -> (connection dict, revision) for every connection added or changed, and
+        deleted is a dict of name -> revision for every connection deleted or renamed. Pass -1 to get every
+        connection.
+
+        args:
+          revision (int):  The current revision returned by an earlier call, or -1.
+        '''
+        with self._lock:
+            current = int(self._db.execute("SELECT value FROM meta WHERE key = 'revision'").fetchone()[0])
+            # Later commits have revisions above current, and are returned by the next call.
+            changed = {}
+            for row in self._db.execute(f'SELECT {_COLUMNS}, revision FROM connections WHERE revision > ? AND revision <= ?', (revision, current)):
+                name, connection = _from_row(row)
+                changed[name] = (connection, row[5])
+            deleted = dict(self._db.execute('SELECT name, revision FROM deleted_connections WHERE revision > ? AND revision <= ?', (revision, current)))
+        return current, changed, deleted
+
+    def _migrate(self, legacy_file:str):
+        '''
+        Imports the connections from a pickled connections file, unless a migration has already been done.
+        '''
+        with self._lock, self._db:
+            if self._db.execute("SELECT 1 FROM meta WHERE key = 'migrated'").fetchone():
+                return
+            if legacy_file and pathlib.Path(legacy_file).is_file():
+                with open(legacy_file, 'rb') as f:
+                    data = pickle.load(f)
+                self._db.executemany(f'INSERT OR IGNORE INTO connections ({_COLUMNS}) VALUES (?, ?, ?, ?, ?)',
+                                     (_to_row(name, connection) for name, connection in data.items()))
+            self._db.execute("INSERT INTO meta (key, value) VALUES ('migrated', ?)", (legacy_file or '',))
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    @Metrics.timed(STORAGE_SECONDS, operation='all')
+    @Tracing.traced('ConnectionDatabase.all', 'storage')
+    def all(self):
+        '''
+        Returns a dict of every stored connection, keyed by connection name.
+        '''
+        with self._lock:
+            return dict(_from_row(row) for row in self._db.execute(f'SELECT {_COLUMNS} FROM connections'))
+
+    @Metrics.timed(STORAGE_SECONDS, operation='get')
+    @Tracing.traced('ConnectionDatabase.get', 'storage')
+    def get(self, name:str):
+        '''
+        Returns the connection with the provided name, or None if there isn't one.
+
+        args:
+          name (str):  The connection name.
+        '''
+        with self._lock:
+            row = self._db.execute(f'SELECT {_COLUMNS} FROM connections WHERE name = ?', (name,)).fetchone()
+        return None if row is None else _from_row(row)[1]
+
+    @Metrics.timed(STORAGE_SECONDS, operation='find_by_hostname')
+    @Tracing.traced('ConnectionDatabase.find_by_hostname', 'storage')
+    def find_by_hostname(self, hostname:str):
+        '''
+        Returns a list of the names of connections with the provided hostname.
+        '''
+        with self._lock:
+            return [row[0] for row in self._db.execute('SELECT name FROM connections WHERE hostname = ?', (hostname,))]
+
+    @Metrics.timed(STORAGE_SECONDS, operation='find_by_ip')
+    @Tracing.traced('ConnectionDatabase.find_by_ip', 'storage')
+    def find_by_ip(self, ip:str):
+        '''
+        Returns a list of the names of connections with the provided IP address.
+        '''
+        with self._lock:
+            return [row[0] for row in self._db.execute('SELECT name FROM connections WHERE ip_address = ?', (ip,))]
+
+    def insert(self, name:str, connection:dict):
+        '''
+        Adds a new connection. Raises KeyError if a connection with that name already exists.
+
+        args:
+          name (str):  The connection name.
+          connection (dict):  The connection details.
+        '''
+        self.insert_many({name: connection})
+
+    @Metrics.timed(STORAGE_SECONDS, operation='insert_many')
+    @Tracing.traced('ConnectionDatabase.insert_many', 'storage')
+    def insert_many(self, connections:dict):
+        '''
+        Adds several new connections in a single transaction, and returns their revision. Raises KeyError,
+        and adds none of them, if any of the names already exists.
+
+        args:
+          connections (dict):  Connection details keyed by connection name.
+        '''
+        return self.insert_rows(_to_row(name, connection) for name, connection in connections.items())
+
+    @Metrics.timed(STORAGE_SECONDS, operation='insert_rows')
+    @Tracing.traced('ConnectionDatabase.insert_rows', 'storage')
+    def insert_rows(self, rows):
+        '''
+        Adds new connections from an iterable of rows in a single transaction, consuming it lazily so a large
+        import never has to be held in memory, and returns their revision. Raises KeyError, and adds none of
+        them, if any of the names already exists.
+
+        args:
+          rows (iterable):  (name, hostname, ip address, vnc password, vnc port) tuples.
+        '''
+        try:
+            with self._lock, self._db:
+                revision = self._next_revision()
+                self._db.executemany(_INSERT, (row + (revision,) for row in rows))
+        except sqlite3.IntegrityError:
+            raise KeyError('A connection with that name already exists.')
+        return revision
+
+    @Metrics.timed(STORAGE_SECONDS, operation='update')
+    @Tracing.traced('ConnectionDatabase.update', 'storage')
+    def update(self, old_name:str, name:str, connection:dict, revision:int=None):
+        '''
+        Replaces a connection, renaming it if name differs from old_name, and returns its new revision.
+        Raises KeyError if old_name doesn't exist, or if it is being renamed to a name which already exists.
+        If revision is provided, raises ConflictError instead unless old_name still has that revision.
+
+        args:
+          old_name (str):  The current connection name.
+          name (str):  The new connection name.
+          connection (dict):  The new connection details.
+          revision (int):  The connection's revision when it was loaded. (default None, don't check)
+        '''
+        try:
+            with self._lock, self._db:
+                new_revision = self._next_revision()
+                query = 'UPDATE connections SET name = ?, hostname = ?, ip_address = ?, vnc_password = ?, vnc_port = ?, revision = ? WHERE name = ?'
+                parameters = _to_row(name, connection) + (new_revision, old_name)
+                if revision is not None:
+                    query += ' AND revision = ?'
+                    parameters += (revision,)
+                if self._db.execute(query, parameters).rowcount == 0:
+                    if revision is not None:
+                        raise ConflictError(f'{old_name} was changed or deleted by someone else.')
+                    raise KeyError(old_name)
+                if name != old_name:
+                    self._db.execute('INSERT OR REPLACE INTO deleted_connections (name, revision) VALUES (?, ?)', (old_name, new_revision))
+        except sqlite3.IntegrityError:
+            raise KeyError('A connection with that name already exists.')
+        return new_revision
+
+    @Metrics.timed(STORAGE_SECONDS, operation='delete')
+    @Tracing.traced('ConnectionDatabase.delete', 'storage')
+    def delete(self, name:str, revision:int=None):
+        '''
+        Removes a connection. Does nothing if it doesn't exist. If revision is provided, raises
+        ConflictError if the connection has been changed since it had that revision.
+
+        args:
+          name (str):  The connection name.
+          revision (int):  The connection's revision when it was loaded. (default None, don't check)
+        '''
+        with self._lock, self._db:
+            new_revision = self._next_revision()
+            stored = self._db.execute('SELECT revision FROM connections WHERE name = ?', (name,)).fetchone()
+            if stored is None:
+                return
+            if revision is not None and stored[0] != revision:
+                raise ConflictError(f'{name} was changed by someone else.')
+            self._db.execute('DELETE FROM connections WHERE name = ?', (name,))
+            self._db.execute('INSERT OR REPLACE INTO deleted_connections (name, revision) VALUES (?, ?)', (name, new_revision))
+
+    @Metrics.timed(STORAGE_SECONDS, operation='replace_all')
+    @Tracing.traced('ConnectionDatabase.replace_all', 'storage')
+    def replace_all(self, connections:dict):
+        '''
+        Makes the stored connections match the provided dict in a single transaction, only writing
+        the records which were added, changed or removed.
+
+        args:
+          connections (dict):  Connection details keyed by connection name.
+        '''
+        with self._lock, self._db:
+            revision = self._next_revision()
+            stored = {row[0]: row for row in self._db.execute(f'SELECT {_COLUMNS} FROM connections')}
+            removed = [(name,) for name in stored if name not in connections]
+            changed = [row + (revision,) for row in (_to_row(name, connection) for name, connection in connections.items()) if stored.get(row[0]) != row]
+            self._db.executemany('DELETE FROM connections WHERE name = ?', removed)
+            self._db.executemany('INSERT OR REPLACE INTO deleted_connections (name, revision) VALUES (?, ?)', (row + (revision,) for row in removed))
+            self._db.executemany(f'INSERT OR REPLACE INTO connections ({_COLUMNS}, revision) VALUES (?, ?, ?, ?, ?, ?)', changed)
+
+
+class ConnectionStore(Mapping):
+    '''
+    Process-wide, in-memory view of the known connections, shared by the App and all Toplevels.
+    Behaves as a read-only dict of connection name -> connection dict, with hash indexes by IP address
+    and hostname. Changes are written through to a ConnectionDatabase, one record at a time, and
+    announced to subscribers.\n
+    Subscribers are called as callback(event, name, old_name), where event is 'insert', 'update' or
+    'delete', and old_name is the previous name of a renamed connection (otherwise equal to name).
+    After a bulk change the event is 'load', with name and old_name None, and subscribers should
+    re-read every connection.\n
+    Other instances sharing the database file are kept in sync by calling sync() regularly, which merges
+    just the connections they have changed. Updates and deletes only succeed if the connection hasn't
+    been changed elsewhere since it was last merged, and raise ConflictError otherwise.
+    '''
+    def __init__(self, database:ConnectionDatabase):
+        '''
+        args:
+          database (ConnectionDatabase):  The database the connections are loaded from and saved to.
+        '''
+        self.database = database
+        self._lock = threading.RLock()
+        self._connections = {}
+        self._by_ip = defaultdict(set)
+        self._by_hostname = defaultdict(set)
+        self._revisions = {}  # Connection name -> the revision it was loaded or saved with.
+        self._listeners = []
+        self._data_version = database.data_version()
+        self._revision, changed, deleted = database.changes_since(-1)
+        for name, (connection, revision) in changed.items():
+            self._add(name, connection, revision)
+
+    def __getitem__(self, name:str):
+        return self._connections[name]
+
+    def __iter__(self):
+        return iter(list(self._connections))
+
+    def __len__(self):
+        return len(self._connections)
+
+    def __contains__(self, name):
+        return name in self._connections
+
+    def items(self):
+        '''
+        Returns a list of (name, connection) pairs, safe to iterate while other threads make changes.
+        '''
+        with self._lock:
+            return list(self._connections.items())
+
+    def values(self):
+        '''
+        Returns a list of connections, safe to iterate while other threads make changes.
+        '''
+        with self._lock:
+            return list(self._connections.values())
+
+    def _add(self, name:str, connection:dict, revision:int=0):
+        connection = _from_row(_to_row(name, connection))[1]
+        self._connections[name] = connection
+        self._revisions[name] = revision
+        self._by_ip[connection['ip address']].add(name)
+        self._by_hostname[connection['hostname']].add(name)
+
+    def _remove(self, name:str):
+        connection = self._connections.pop(name)
+        del self._revisions[name]
+        for index, key in ((self._by_ip, connection['ip address']), (self._by_hostname, connection['hostname'])):
+            index[key].discard(name)
+            if not index[key]:
+                del index[key]
+        return connection
+
+    def _notify(self, event:str, name:str, old_name:str=None):
+        for callback in list(self._listeners):
+            callback(event, name, old_name if old_name is not None else name)
+
+    def subscribe(self, callback):
+        '''
+        Registers a callback(event, name, old_name) to be called after each change.
+        '''
+        self._listeners.append(callback)
+
+    def unsubscribe(self, callback):
+        '''
+        Removes a callback registered with subscribe().
+        '''
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    def find_by_ip(self, ip:str):
+        '''
+        Returns a set of the names of connections with the provided IP address.
+        '''
+        with self._lock:
+            return set(self._by_ip.get(ip, ()))
+
+    def find_by_hostname(self, hostname:str):
+        '''
+        Returns a set of the names of connections with the provided hostname.
+        '''
+        with self._lock:
+            return set(self._by_hostname.get(hostname, ()))
+
+    def insert(self, name:str, connection:dict):
+        '''
+        Adds a new connection. Raises KeyError if a connection with that name already exists.
+        '''
+        self.insert_many({name: connection})
+
+    def insert_many(self, connections:dict):
+        '''
+        Adds several new connections in a single transaction. Raises KeyError, and adds none of them,
+        if any of the names already exists.
+        '''
+        with self._lock:
+            if any(name in self._connections for name in connections):
+                raise KeyError('A connection with that name already exists.')
+            revision = self.database.insert_many(connections)
+            for name, connection in connections.items():
+                self._add(name, connection, revision)
+        for name in connections:
+            self._notify('insert', name)
+
+    def duplicate_of(self, name:str, connection:dict):
+        '''
+        Returns the reason a connection would duplicate a known one: 'name' if its name is taken,
+        'hostname' or 'ip address' if a known connection has the same hostname or IP address and port.
+        Returns None if it isn't a duplicate.
+        '''
+        with self._lock:
+            if name in self._connections:
+                return 'name'
+            port = str(connection.get('vnc port', '5900'))
+            for key, index in (('hostname', self._by_hostname), ('ip address', self._by_ip)):
+                value = connection.get(key, '')
+                if value != '' and any(self._connections[other]['vnc port'] == port for other in index.get(value, ())):
+                    return key
+        return None
+
+    def insert_new(self, connections, on_skip=None):
+        '''
+        Adds connections from an iterable of (name, connection) pairs in a single transaction, skipping any
+        which duplicate_of() a known connection or one added earlier in the same call. The iterable is
+        consumed lazily. Subscribers receive a single 'load' event. Returns the number of connections added.
+
+        args:
+          connections (iterable):  (name, connection dict) pairs.
+          on_skip (function):  Called as on_skip(name, connection, reason) for each skipped connection. (default None)
+        '''
+        added = []
+
+        def rows():
+            for name, connection in connections:
+                reason = self.duplicate_of(name, connection)
+                if reason is not None:
+                    if on_skip is not None:
+                        on_skip(name, connection, reason)
+                    continue
+                self._add(name, connection)
+                added.append(name)
+                yield _to_row(name, connection)
+
+        with self._lock:
+            try:
+                revision = self.database.insert_rows(rows())
+            except BaseException:
+                for name in added:
+                    self._remove(name)
+                raise
+            for name in added:
+                self._revisions[name] = revision
+        if added:
+            self._notify('load', None)
+        return len(added)
+
+    def update(self, old_name:str, name:str, connection:dict):
+        '''
+        Replaces a connection, renaming it if name differs from old_name. Raises KeyError if old_name
+        doesn't exist, or if it is being renamed to a name which already exists.
+        '''
+        with self._lock:
+            if old_name not in self._connections:
+                raise KeyError(old_name)
+            if name != old_name and name in self._connections:
+                raise KeyError('A connection with that name already exists.')
+            try:
+                revision = self.database.update(old_name, name, connection, self._revisions[old_name])
+            except ConflictError:
+                self.sync(force=True)
+                raise
+            self._remove(old_name)
+            self._add(name, connection, revision)
+        self._notify('update', name, old_name)
+
+    def delete(self, name:str):
+        '''
+        Removes a connection. Does nothing if it doesn't exist.
+        '''
+        with self._lock:
+            if name not in self._connections:
+                return
+            try:
+                self.database.delete(name, self._revisions[name])
+            except ConflictError:
+                self.sync(force=True)
+                raise
+            self._remove(name)
+        self._notify('delete', name)
+
+    @Tracing.traced('ConnectionStore.sync', 'storage')
+    def sync(self, force:bool=False, timeout:float=None):
+        '''
+        Merges the connections other instances have added, changed or deleted since the last sync, and
+        announces each change to subscribers (or a single 'load' event after many changes). Returns the
+        number of connections changed. Only checks PRAGMA data_version, which is cheap, unless another
+        connection has written to the database since the last sync, so it can be called often.
+        Raises sqlite3.Error if the database can't be read, e.g. while another instance holds a lock on it.
+
+        args:
+          force (bool):  If True, look for changes even if data_version hasn't changed. (default False)
+          timeout (float):  Maximum seconds to wait for another connection's lock. (default None, the
+                            sqlite3 connection's timeout)
+        '''
+        events = []
+        with self._lock, (self.database.busy_timeout(timeout) if timeout is not None else contextlib.nullcontext()):
+            data_version = self.database.data_version()
+            if data_version == self._data_version and not force:
+                return 0
+            revision, changed, deleted = self.database.changes_since(self._revision)
+            self._data_version = data_version
+            self._revision = revision
+            for name, revision in deleted.items():
+                if name in self._connections and self._revisions[name] < revision:
+                    self._remove(name)
+                    events.append(('delete', name))
+            for name, (connection, revision) in changed.items():
+                if name in self._connections:
+                    if self._revisions[name] == revision:
+                        continue  # Saved by this instance.
+                    self._remove(name)
+                    events.append(('update', name))
+                else:
+                    events.append(('insert', name))
+                self._add(name, connection, revision)
+        if len(events) > _SYNC_EVENT_LIMIT:
+            self._notify('load', None)
+        else:
+            for event, name in events:
+                self._notify(event, name)
+        return len(events)
+
+
+_SCAN_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS scan_results (
+    address INTEGER NOT NULL,
+    port INTEGER NOT NULL,
+    alive INTEGER NOT NULL,
+    name TEXT NOT NULL DEFAULT '',
+    checked REAL NOT NULL,
+    last_seen REAL,
+    PRIMARY KEY (address, port)
+);
+'''
+
+
+class ScanResultCache(object):
+    '''
+    Stores the last result of each address and port probed by a network scan, with the time it was checked
+    and the time it was last seen alive, so later scans can skip or prioritise addresses. Results are dicts:
+    {'alive': bool, 'name': str, 'checked': float, 'last seen': float or None}, times being time.time() values.\n
+    Empty results are only useful for a while, and are removed by prune(). Live results are kept until a
+    later scan finds them gone.
+    '''
+    def __init__(self, file:str=SCAN_CACHE_FILE):
+        '''
+        args:
+          file (str):  The database file path and name. Use a different file from the ConnectionDatabase,
+                       so scans don't make other instances look for connection changes.
+        '''
+        self.file = file
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(file, check_same_thread=False)
+        self._db.executescript(_SCAN_SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def lookup(self, ranges:list, alive_only:bool=False):
+        '''
+        Generator.\n
+        Yields ((ip, port), result) for each stored result within the provided address ranges, reading them
+        in batches so large ranges don't have to be held in memory.
+
+        args:
+          ranges (list):  (first, last) integer address ranges, as returned by SelectorTools.parse_targets().
+          alive_only (bool):  If True, only yield results which were alive. (default False)
+        '''
+        query = 'SELECT address, port, alive, name, checked, last_seen FROM scan_results WHERE address BETWEEN ? AND ?'
+        if alive_only:
+            query += ' AND alive = 1'
+        # Timed here rather than with Metrics.timed and Tracing.traced, which would only time creating the
+        # generator. The time includes the caller's work between results.
+        started = time.perf_counter()
+        trace_start = Tracing.now()
+        count = 0
+        try:
+            for first, last in ranges:
+                start = (first, -1)  # Continue after the last (address, port) read.
+                while True:
+                    with self._lock:
+                        rows = self._db.execute(query + ' AND (address, port) > (?, ?) ORDER BY address, port LIMIT 1000', (first, last) + start).fetchall()
+                    for address, port, alive, name, checked, last_seen in rows:
+                        count += 1
+                        yield (str(ipaddress.IPv4Address(address)), port), {
+                            'alive': bool(alive), 'name': name, 'checked': checked, 'last seen': last_seen}
+                    if len(rows) < 1000:
+                        break
+                    start = rows[-1][:2]
+        finally:
+            if Metrics.enabled:
+                STORAGE_SECONDS.observe(time.perf_counter() - started, operation='scan_results_lookup')
+            if Tracing.enabled:
+                Tracing.complete('ScanResultCache.lookup', 'storage', trace_start, {'results': count})
+
+    def empty_since(self, ip:str, ports:list, since:float):
+        '''
+        Returns True if every one of the provided ports at ip was found empty after the time since.
+
+        args:
+          ip (str):  The IP address.
+          ports (list):  Port numbers.
+          since (float):  time.time() value.
+        '''
+        with self._lock:
+            rows = self._db.execute('SELECT port FROM scan_results WHERE address = ? AND alive = 0 AND checked > ?',
+                                    (int(ipaddress.IPv4Address(ip)), since)).fetchall()
+        return set(ports) <= {row[0] for row in rows}
+
+    def alive(self):
+        '''
+        Returns a list of {'ip', 'port', 'name', 'last seen'} dicts for every address and port which was
+        alive when last checked.
+        '''
+        with self._lock:
+            rows = self._db.execute('SELECT address, port, name, last_seen FROM scan_results WHERE alive = 1 ORDER BY address, port').fetchall()
+        return [{'ip': str(ipaddress.IPv4Address(address)), 'port': port, 'name': name, 'last seen': last_seen}
+                for address, port, name, last_seen in rows]
+
+    @Metrics.timed(STORAGE_SECONDS, operation='scan_results_record')
+    @Tracing.traced('ScanResultCache.record_many', 'storage')
+    def record_many(self, results, checked:float=None):
+        '''
+        Stores several scan results in a single transaction.
+
+        args:
+          results (iterable):  Scan result dicts with 'ip', 'port', 'alive' and 'name' keys, as yielded by SelectorTools.scan().
+          checked (float):  time.time() value when the results were checked. (default now)
+        '''
+        checked = checked or time.time()
+        rows = [(int(ipaddress.IPv4Address(item['ip'])), item['port'], int(item['alive']), item['name'] if item['alive'] else '',
+                 checked, checked if item['alive'] else None) for item in results]
+        with self._lock, self._db:
+            self._db.executemany('''INSERT INTO scan_results (address, port, alive, name, checked, last_seen) VALUES (?, ?, ?, ?, ?, ?)
+                                    ON CONFLICT (address, port) DO UPDATE SET alive = excluded.alive, name = excluded.name,
+                                    checked = excluded.checked, last_seen = COALESCE(excluded.last_seen, scan_results.last_seen)''', rows)
+
+    @Metrics.timed(STORAGE_SECONDS, operation='scan_results_prune')
+    def prune(self, max_age:float):
+        '''
+        Removes empty results which haven't been checked for max_age seconds.
+        '''
+        with self._lock, self._db:
+            self._db.execute('DELETE FROM scan_results WHERE alive = 0 AND checked < ?', (time.time() - max_age,))
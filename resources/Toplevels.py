@@ -2,9 +2,36 @@ import tkinter as tk
 from tkinter import ttk
 import tkinter.font as tkFont
 from tkinter import messagebox
-from PIL import ImageTk
 import webbrowser
+import os
+import bisect
+import threading
+import queue
+from collections import OrderedDict
 import resources.SelectorTools as SelectorTools
+import resources.Resolvers as Resolvers
+import resources.Storage as Storage
+import resources.Tracing as Tracing
+
+
+_images = {}
+
+def load_image(name:str):
+    '''
+    Returns the named .png image from the resources folder as a Tk image, loading it on first use.
+    Pillow is only needed if this version of Tk can't read .png files (before Tk 8.6).
+
+    args:
+      name (str):  The image file name, without the extension.
+    '''
+    if name not in _images:
+        file = os.path.join('resources', f'{name}.png')
+        try:
+            _images[name] = tk.PhotoImage(file=file)
+        except tk.TclError:
+            from PIL import ImageTk
+            _images[name] = ImageTk.PhotoImage(file=file)
+    return _images[name]
 
 
 class Hyperlink(tk.Label):
@@ -72,6 +99,243 @@ class Tooltip(object):
             self.tw.destroy()
 
 
+class VirtualListbox(tk.Frame):
+    '''
+    A sorted, single-selection listbox with a scrollbar, for very large lists. Items are kept in a
+    sorted index and changed one at a time with insert(), remove() and rename(), and only the rows
+    currently in view are pushed into the underlying tk.Listbox. The scroll position and selection
+    are kept across changes.\n
+    Generates <<ListboxSelect>> when the user changes the selection.
+    '''
+    def __init__(self, parent, **kwargs):
+        '''
+        args:
+          parent (tk widget):  The parent of this widget.
+          kwargs:  Options passed on to the underlying tk.Listbox.
+        '''
+        tk.Frame.__init__(self, parent)
+        self._items = []  # Sorted list of every item.
+        self._top = 0  # Index in self._items of the first visible row.
+        self._rows = 1  # Number of rows which fit in the listbox, updated on <Configure>.
+        self._selected = None
+        self._listbox = tk.Listbox(self, exportselection=False, selectmode=tk.BROWSE, **kwargs)
+        self._listbox.pack(fill=tk.BOTH, side=tk.LEFT, expand=True)
+        self._scrollbar = tk.Scrollbar(self, command=self._on_scrollbar)
+        self._scrollbar.pack(side=tk.LEFT, fill=tk.Y)
+        self._row_height = tkFont.Font(font=self._listbox.cget('font')).metrics('linespace') + 1
+        self._listbox.bind('<<ListboxSelect>>', self._on_select)
+        self._listbox.bind('<Configure>', self._on_configure)
+        self._listbox.bind('<MouseWheel>', lambda event: self.scroll(-1 if event.delta > 0 else 1))
+        self._listbox.bind('<Button-4>', lambda event: self.scroll(-1))
+        self._listbox.bind('<Button-5>', lambda event: self.scroll(1))
+        self._listbox.bind('<Up>', lambda event: self._move_selection(-1))
+        self._listbox.bind('<Down>', lambda event: self._move_selection(1))
+
+    def __len__(self):
+        return len(self._items)
+
+    def set_items(self, items):
+        '''
+        Replaces every item in the list.
+        '''
+        self._items = sorted(items)
+        if self._selected is not None and not self._contains(self._selected):
+            self._selected = None
+        self._top = max(0, min(self._top, len(self._items) - self._rows))
+        self._render()
+
+    def _index(self, item):
+        return bisect.bisect_left(self._items, item)
+
+    def _contains(self, item):
+        i = self._index(item)
+        return i < len(self._items) and self._items[i] == item
+
+    def insert(self, item):
+        '''
+        Adds an item in its sorted position.
+        '''
+        i = self._index(item)
+        if i < len(self._items) and self._items[i] == item:
+            return
+        self._items.insert(i, item)
+        if i < self._top:
+            # Keep the same rows in view.
+            self._top += 1
+            self._update_scrollbar()
+        else:
+            self._render()
+
+    def remove(self, item):
+        '''
+        Removes an item, clearing the selection if it was selected.
+        '''
+        i = self._index(item)
+        if i >= len(self._items) or self._items[i] != item:
+            return
+        del self._items[i]
+        if item == self._selected:
+            self._selected = None
+        if i < self._top:
+            self._top -= 1
+            self._update_scrollbar()
+        else:
+            self._top = max(0, min(self._top, len(self._items) - self._rows))
+            self._render()
+
+    def rename(self, old_item, new_item):
+        '''
+        Replaces an item with a new one, keeping it selected if it was selected.
+        '''
+        selected = self._selected == old_item
+        self.remove(old_item)
+        self.insert(new_item)
+        if selected:
+            self._selected = new_item
+            self._render()
+
+    def selection(self):
+        '''
+        Returns the selected item, or None if nothing is selected.
+        '''
+        return self._selected
+
+    def select(self, item):
+        '''
+        Selects an item and scrolls it into view.
+        '''
+        if not self._contains(item):
+            return
+        self._selected = item
+        self.see(item)
+
+    def select_clear(self):
+        self._selected = None
+        self._render()
+
+    def see(self, item):
+        '''
+        Scrolls the list, if needed, so the provided item is in view.
+        '''
+        i = self._index(item)
+        if i < self._top:
+            self._top = i
+        elif i >= self._top + self._rows:
+            self._top = i - self._rows + 1
+        self._render()
+
+    def scroll(self, rows:int):
+        '''
+        Scrolls the list by the provided number of rows.
+        '''
+        top = max(0, min(self._top + rows, len(self._items) - self._rows))
+        if top != self._top:
+            self._top = top
+            self._render()
+        return 'break'
+
+    @Tracing.traced('listbox render', 'ui')
+    def _render(self):
+        '''
+        Pushes the visible rows into the listbox, and updates the selection and scrollbar.
+        '''
+        visible = self._items[self._top:self._top + self._rows]
+        self._listbox.delete(0, tk.END)
+        if visible:
+            self._listbox.insert(0, *visible)
+        if self._selected is not None:
+            i = self._index(self._selected) - self._top
+            if 0 <= i < len(visible):
+                self._listbox.selection_set(i)
+        self._update_scrollbar()
+
+    def _update_scrollbar(self):
+        if not self._items:
+            self._scrollbar.set(0, 1)
+            return
+        self._scrollbar.set(self._top / len(self._items), min(1, (self._top + self._rows) / len(self._items)))
+
+    def _on_scrollbar(self, action, value, unit=None):
+        if action == 'moveto':
+            self._top = max(0, min(int(float(value) * len(self._items)), len(self._items) - self._rows))
+            self._render()
+        elif action == 'scroll':
+            self.scroll(int(value) * (self._rows if unit == 'pages' else 1))
+
+    def _on_configure(self, event=None):
+        rows = max(1, self._listbox.winfo_height() // self._row_height)
+        if rows != self._rows:
+            self._rows = rows
+            self._top = max(0, min(self._top, len(self._items) - self._rows))
+            self._render()
+
+    def _on_select(self, event=None):
+        selection = self._listbox.curselection()
+        if selection:
+            self._selected = self._items[self._top + selection[0]]
+            self.event_generate('<<ListboxSelect>>')
+
+    def _move_selection(self, step:int):
+        if not self._items:
+            return 'break'
+        i = self._index(self._selected) + step if self._selected is not None else 0
+        self.select(self._items[max(0, min(i, len(self._items) - 1))])
+        self.event_generate('<<ListboxSelect>>')
+        return 'break'
+
+
+class MainThreadQueue(object):
+    '''
+    Runs callbacks posted from any thread on the Tk main thread. Callbacks are posted under a key, and
+    only the latest callback for each key is kept, so a burst of updates is coalesced into at most one
+    call per key each interval.\n
+    While nothing is posted the queue is checked less and less often, up to every idle_interval, so an
+    idle window rarely wakes the Tk loop. Other threads can't call after() themselves, so the first
+    callback posted after a quiet spell may wait up to idle_interval.
+    '''
+    def __init__(self, widget, interval:int=16, idle_interval:int=200):
+        '''
+        args:
+          widget (tk widget):  Widget whose after() loop runs the callbacks.
+          interval (int):  Milliseconds between runs while callbacks are being posted, about one frame. (default 16)
+          idle_interval (int):  Longest milliseconds between runs while nothing is posted. (default 200)
+        '''
+        self.widget = widget
+        self.interval = interval
+        self.idle_interval = idle_interval
+        self._delay = interval
+        self._pending = OrderedDict()
+        self._lock = threading.Lock()
+        self._job = self.widget.after(self.interval, self._run)
+
+    def post(self, key, callback):
+        '''
+        Schedules callback() to run on the main thread, replacing any callback still pending for key.
+        Safe to call from any thread.
+        '''
+        with self._lock:
+            self._pending[key] = callback
+            self._pending.move_to_end(key)
+
+    def _run(self):
+        with self._lock:
+            pending, self._pending = self._pending, OrderedDict()
+        if pending:
+            with Tracing.span('ui queue', 'ui', callbacks=len(pending)):
+                for callback in pending.values():
+                    callback()
+            self._delay = self.interval
+        else:
+            self._delay = min(self.idle_interval, self._delay * 2)
+        self._job = self.widget.after(self._delay, self._run)
+
+    def stop(self):
+        '''
+        Stops running callbacks. Anything still pending is dropped.
+        '''
+        self.widget.after_cancel(self._job)
+
+
 class About(tk.Toplevel):
     '''
     Displays the About info for VNC Selector.
@@ -79,7 +343,6 @@ class About(tk.Toplevel):
     def __init__(self, parent):
         tk.Toplevel.__init__(self, parent)
         self.title('About')
-        self._info_image = ImageTk.PhotoImage(file='resources\\info.png')
         self.resizable(False, False)
         x = int(parent.winfo_screenwidth()/2.5)
         y = int(parent.winfo_screenheight()/2.5)
@@ -101,7 +364,7 @@ class About(tk.Toplevel):
         link.pack(anchor=tk.NW)
         canvas = tk.Canvas(image_frame, width=120, height=120)
         canvas.pack(fill=tk.BOTH)
-        canvas.create_image(62, 62, image=self._info_image)
+        canvas.create_image(62, 62, image=load_image('info'))
         tk.Button(image_frame, text='Close', command=self.destroy, width=10).pack()
 
 
@@ -169,21 +432,23 @@ class AddConnection(tk.Toplevel):
         if hostname == '' and ip == '':
             messagebox.showerror('Add Connection Error', 'Failed to add connection. You must include either a Hostname or an IP Address.')
             return
+        try:
+            port = str(SelectorTools.parse_port(port))
+        except ValueError:
+            messagebox.showerror('Add Connection Error', 'Failed to add connection. The VNC Port must be a number from 1 to 65535.')
+            return
         if connection == '': 
             connection = hostname or ip
-        if port == '':
-            port = '5900'
-        available_connections = SelectorTools.get_connections_from_file()
-        if connection in available_connections.keys():
+        try:
+            SelectorTools.get_connection_store().insert(connection, {
+                'hostname': hostname, 
+                'ip address': ip, 
+                'vnc password': password, 
+                'vnc port': port,
+                'is alive': False})
+        except KeyError:
             messagebox.showerror('Add Connection Error', 'Failed to add connection. A connection with that name already exists.')
             return
-        available_connections[connection] = {
-            'hostname': hostname, 
-            'ip address': ip, 
-            'vnc password': password, 
-            'vnc port': port,
-            'is alive': False}
-        SelectorTools.save_connections_to_file(available_connections)
         self.destroy()
 
 
@@ -243,12 +508,12 @@ class EditConnection(tk.Toplevel):
         tk.Button(button_frame, text='Cancel', width=10, command=self.destroy).pack(side=tk.RIGHT)
 
         # Widget config settings.
-        available_connections = SelectorTools.get_connections_from_file()
-        self._hostname_entry.insert(0, available_connections[self._old_connection]['hostname'])
-        self._ip_entry.insert(0, available_connections[self._old_connection]['ip address'])
+        old_connection = SelectorTools.get_connection_store()[self._old_connection]
+        self._hostname_entry.insert(0, old_connection['hostname'])
+        self._ip_entry.insert(0, old_connection['ip address'])
         self._connection_entry.insert(0, self._old_connection)
-        self._password_entry.insert(0, available_connections[self._old_connection]['vnc password'])
-        self._port_entry.insert(0, available_connections[self._old_connection]['vnc port'])
+        self._password_entry.insert(0, old_connection['vnc password'])
+        self._port_entry.insert(0, old_connection['vnc port'])
 
     def save(self):
         hostname = self._hostname_entry.get()
@@ -256,29 +521,37 @@ class EditConnection(tk.Toplevel):
         connection = self._connection_entry.get()
         password = self._password_entry.get()
         port = self._port_entry.get() or '5900'
-        available_connections = SelectorTools.get_connections_from_file()
+        connections = SelectorTools.get_connection_store()
 
         if hostname == '' and ip == '':
             messagebox.showerror('Edit Connection Error', 'Failed to save changes. You must include either a Hostname or an IP Address.')
             return
+        if self._old_connection not in connections:
+            messagebox.showerror('Edit Connection Error', 'Failed to save changes. The connection has been deleted by someone else.')
+            return
+        try:
+            port = str(SelectorTools.parse_port(port))
+        except ValueError:
+            messagebox.showerror('Edit Connection Error', 'Failed to save changes. The VNC Port must be a number from 1 to 65535.')
+            return
         if connection == '': 
             connection = hostname or ip
         if password == '':
-            password = available_connections[self._old_connection]['vnc password']
-        if port == '':
-            port = '5900'
-
-        del available_connections[self._old_connection]
-        if connection in available_connections.keys():
+            password = connections[self._old_connection]['vnc password']
+
+        try:
+            connections.update(self._old_connection, connection, {
+                'hostname': hostname, 
+                'ip address': ip, 
+                'vnc password': password, 
+                'vnc port': port,
+                'is alive': False})
+        except Storage.ConflictError:
+            messagebox.showerror('Edit Connection Error', 'Failed to save changes. The connection has been changed or deleted by someone else, and its latest details have been loaded.')
+            return
+        except KeyError:
             messagebox.showerror('Edit Connection Error', 'Failed to save changes. A connection with that name already exists.')
             return
-        available_connections[connection] = {
-            'hostname': hostname, 
-            'ip address': ip, 
-            'vnc password': password, 
-            'vnc port': port,
-            'is alive': False}
-        SelectorTools.save_connections_to_file(available_connections)
         self.destroy()
 
 
@@ -296,16 +569,24 @@ class DeleteConnection(object):
     def show(self):
         self._selection = messagebox.askyesno(self.title, self.message)
         if self._selection:
-            available_connections = SelectorTools.get_connections_from_file()
-            del available_connections[self._connection]
-            SelectorTools.save_connections_to_file(available_connections)
+            try:
+                SelectorTools.get_connection_store().delete(self._connection)
+            except Storage.ConflictError:
+                messagebox.showerror('Delete Connection Error', 'Failed to delete the connection. It has been changed by someone else, and its latest details have been loaded.')
 
 
 class ScanNetwork(tk.Toplevel):
     '''
     Displays the window to configure and start a network scan, and then lists the discovered
-    connections so the user can add them to the available connections list.
+    connections so the user can add them to the available connections list. The list starts with
+    the servers found by earlier scans, from the scan result cache.\n
+    The scan runs on a background thread, which passes discovered connections (and servers which
+    have gone) to the window through a bounded queue drained with after().
     '''
+    DRAIN_INTERVAL = 50  # Milliseconds between checks of the results queue.
+    DRAIN_BATCH = 200  # Maximum number of results added to the listbox per check.
+    NEIGHBOR_OPTIONS = {'All addresses': None, 'ARP table hosts first': 'first', 'ARP table hosts only': 'only'}
+
     def __init__(self, parent):
         tk.Toplevel.__init__(self, parent)
         self.title('Scan Network')
@@ -316,15 +597,28 @@ class ScanNetwork(tk.Toplevel):
 
         # Instance Variables.
         self._this_pc = SelectorTools.get_this_pc_info()
-        self._known_connections = SelectorTools.get_connections_from_file()
-        self._available_list = tk.StringVar()
-        self._connections_discovered = []
+        self._known_connections = SelectorTools.get_connection_store()
+        self._connections_discovered = []  # Discovered connections, in listbox order.
+        self._discovered_index = {}  # (ip, port) -> index in _connections_discovered.
+        self._results = queue.Queue(maxsize=1000)
+        self._stop_scan = threading.Event()
+        self._scan_finished = threading.Event()
+        self._scan_thread = None
+        self._scanned = 0  # Number of addresses scanned so far, updated by the scan thread.
+        self._last_scanned = ''
+        self._total = 0
+        self._drain_job = None
         self._listbox = None  # Assigned to tk.Listbox in create_widgets().
-        self._host_ip = tk.StringVar()
-        self._host_ip.set('.'.join(self._this_pc['ip'].split('.')[:-1]) + '.')
-        self._start_ip = tk.StringVar(self, '1')
-        self._end_ip = tk.StringVar(self, '255')
+        network = '.'.join(self._this_pc['ip'].split('.')[:-1])
+        self._targets = tk.StringVar(self, f'{network}.1-{network}.255')
+        self._exclude = tk.StringVar(self, '')
         self._port = tk.StringVar(self, '5900')
+        self._rate = tk.StringVar(self, '')
+        self._shuffle = tk.IntVar(self, 0)
+        self._handshake = tk.IntVar(self, SelectorTools.get_settings_from_file()['rfb handshake'])
+        self._neighbors = tk.StringVar(self, 'All addresses')
+        self._incremental = tk.IntVar(self, 1)
+        self._changes = {'new': 0, 'gone': 0, 'renamed': 0}
         self._progress_bar = None  # Assigned to ttk.Progressbar in create_widgets().
         self._progress_text = tk.StringVar()
         self._scan_button = None  # Assigned to tk.Button in create_widgets().
@@ -332,6 +626,7 @@ class ScanNetwork(tk.Toplevel):
 
         self.grab_set()
         self.create_widgets()
+        self._show_cached()
 
     def create_widgets(self):
         # Build and pack the frames.
@@ -345,16 +640,30 @@ class ScanNetwork(tk.Toplevel):
 
         # Build and pack the settings frame widgets.
         tk.Label(settings_frame, text='Scan IP Addresses', justify=tk.LEFT).pack(anchor=tk.NW)
-        ip_subframe = tk.Frame(settings_frame)
-        ip_subframe.pack(anchor=tk.NW)
-        tk.Label(ip_subframe, textvariable=self._host_ip, justify=tk.LEFT).pack(side=tk.LEFT, anchor=tk.NW)
-        tk.Entry(ip_subframe, textvariable=self._start_ip, justify=tk.RIGHT, width=3).pack(side=tk.LEFT, anchor=tk.NW)
-        tk.Label(ip_subframe, text='thru').pack(side=tk.LEFT, anchor=tk.NW)
-        tk.Entry(ip_subframe, textvariable=self._end_ip, justify=tk.RIGHT, width=3).pack(side=tk.LEFT, anchor=tk.NW)
+        targets_entry = tk.Entry(settings_frame, textvariable=self._targets, width=30)
+        targets_entry.pack(anchor=tk.NW)
+        Tooltip(targets_entry, 'e.g. 10.20.0.0/16, 10.1.4.10-10.1.7.200, 192.168.0.5')
+        tk.Label(settings_frame, text='Exclude', justify=tk.LEFT).pack(anchor=tk.NW)
+        tk.Entry(settings_frame, textvariable=self._exclude, width=30).pack(anchor=tk.NW)
         port_subframe = tk.Frame(settings_frame)
         port_subframe.pack(anchor=tk.NW)
-        tk.Label(port_subframe, text='Port').pack(side=tk.LEFT, anchor=tk.NW)
-        tk.Entry(port_subframe, textvariable=self._port, width=5).pack(side=tk.RIGHT, anchor=tk.NW)
+        tk.Label(port_subframe, text='Ports').pack(side=tk.LEFT, anchor=tk.NW)
+        port_entry = tk.Entry(port_subframe, textvariable=self._port, width=12)
+        port_entry.pack(side=tk.LEFT, anchor=tk.NW)
+        Tooltip(port_entry, 'e.g. 5900-5910, 5800')
+        tk.Label(port_subframe, text='Max probes/sec').pack(side=tk.LEFT, anchor=tk.NW)
+        tk.Entry(port_subframe, textvariable=self._rate, width=5).pack(side=tk.LEFT, anchor=tk.NW)
+        tk.Checkbutton(settings_frame, variable=self._shuffle, text='Randomize scan order').pack(anchor=tk.NW)
+        tk.Checkbutton(settings_frame, variable=self._handshake, text='Verify VNC handshake').pack(anchor=tk.NW)
+        neighbors_subframe = tk.Frame(settings_frame)
+        neighbors_subframe.pack(anchor=tk.NW)
+        tk.Label(neighbors_subframe, text='Probe').pack(side=tk.LEFT, anchor=tk.NW)
+        neighbors_menu = tk.OptionMenu(neighbors_subframe, self._neighbors, *self.NEIGHBOR_OPTIONS)
+        neighbors_menu.pack(side=tk.LEFT, anchor=tk.NW)
+        Tooltip(neighbors_menu, 'Hosts in the ARP table have answered recently on this network segment.')
+        incremental_button = tk.Checkbutton(settings_frame, variable=self._incremental, text='Skip recently empty addresses')
+        incremental_button.pack(anchor=tk.NW)
+        Tooltip(incremental_button, 'Addresses found empty by a scan within the \'scan cache minutes\' setting are not probed again.')
         self._scan_button = tk.Button(settings_frame, text='Start Scan', command=self.scan)
         self._scan_button.pack(anchor=tk.NE)
 
@@ -362,7 +671,7 @@ class ScanNetwork(tk.Toplevel):
         tk.Label(scan_frame, text='Available to Add:', justify=tk.LEFT).pack(anchor=tk.NW)
         list_subframe = tk.Frame(scan_frame)
         list_subframe.pack(anchor=tk.NW)
-        self._listbox = tk.Listbox(list_subframe, listvariable=self._available_list, selectmode=tk.MULTIPLE, height=6)
+        self._listbox = tk.Listbox(list_subframe, selectmode=tk.MULTIPLE, height=6)
         self._listbox.pack(side=tk.LEFT, anchor=tk.NW)
         self._listbox.bind('<<ListboxSelect>>', self.update_btn_state)
         scrollbar = tk.Scrollbar(list_subframe)
@@ -384,29 +693,179 @@ class ScanNetwork(tk.Toplevel):
         self._listbox.config(yscrollcommand=scrollbar.set)
 
     def scan(self):
-        my_ip = SelectorTools.get_this_pc_info()['ip']
-        self._scan_button.config(state='disabled')
+        '''
+        Starts a scan on a background thread, or stops the running scan.
+        '''
+        if self._scan_thread is not None:
+            self._stop_scan.set()
+            self._scan_button.config(state='disabled')
+            return
+        try:
+            ranges = SelectorTools.parse_targets(self._targets.get(), self._exclude.get())
+            port = SelectorTools.parse_ports(self._port.get())
+            rate = float(self._rate.get()) if self._rate.get().strip() else None
+        except ValueError as e:
+            messagebox.showerror('Scan Error', f'Invalid scan settings. {e}')
+            return
+        neighbors = self.NEIGHBOR_OPTIONS[self._neighbors.get()]
+        neighbor_table = SelectorTools.read_neighbor_table() if neighbors else None
+        if neighbors == 'only':
+            self._total = len(SelectorTools.known_neighbors(ranges, neighbor_table))
+        else:
+            self._total = SelectorTools.count_targets(ranges)
+        self._total *= len(port)
+        if self._total == 0:
+            messagebox.showerror('Scan Error', 'There are no addresses to scan.')
+            return
+
+        self._changes = {'new': 0, 'gone': 0, 'renamed': 0}
+        self._scanned = 0
+        self._last_scanned = ''
         self._progress_bar['value'] = 0
-        self._progress_bar.update()
-        start = int(self._start_ip.get())
-        end = int(self._end_ip.get())
-        port = int(self._port.get())
-        pb_step_size = self._progress_bar['maximum'] / (1 + end - start)
-        known_ips = [ conn['ip address'] for conn in self._known_connections.values()]
-        known_hostnames = [conn['hostname'] for conn in self._known_connections.values()]
-        if 1 <= start < 256 and start < end < 256:
-            for item in SelectorTools.scan(port=port, address_range=(start, end)):
-                if item['alive'] and item['ip'] != my_ip and item['ip'] not in known_ips and item['name'] not in known_hostnames:
-                    self._connections_discovered.append(item)
-                self._progress_bar['value'] += pb_step_size
-                self._progress_text.set(item['ip'])
-                self._progress_bar.update()
-            self._available_list.set(' '.join([conn['name'] for conn in self._connections_discovered]))
+        self._stop_scan.clear()
+        self._scan_finished.clear()
+        self._scan_button.config(text='Stop Scan')
+        skip_empty_for = None if self._incremental.get() else 0
+        self._scan_thread = threading.Thread(target=self._scan_worker, args=(ranges, port, rate, bool(self._shuffle.get()), bool(self._handshake.get()),
+                                                                              neighbors, neighbor_table, skip_empty_for))
+        self._scan_thread.daemon = True
+        self._scan_thread.start()
+        self._drain_job = self.after(self.DRAIN_INTERVAL, self._drain_results)
+
+    def _scan_worker(self, ranges, port, rate, shuffle, handshake, neighbors=None, neighbor_table=None, skip_empty_for=None):
+        '''
+        Scan thread. Queues each newly discovered connection, and each server which has gone, then sets
+        _scan_finished when the scan ends. Takes every setting as an argument, as Tk variables may only
+        be read on the main thread.
+        '''
+        results = SelectorTools.incremental_scan(ranges, port, skip_empty_for=skip_empty_for, shuffle=shuffle, rate=rate,
+                                                 handshake=handshake, neighbors=neighbors, neighbor_table=neighbor_table)
+        try:
+            for item in results:
+                if self._stop_scan.is_set():
+                    break
+                self._scanned += 1
+                self._last_scanned = item['ip']
+                if item['change']:
+                    self._changes[item['change']] += 1
+                if item['alive']:
+                    item = self._discovered(item)
+                elif item['change'] != 'gone':
+                    item = None
+                if item is not None:
+                    while not self._stop_scan.is_set():
+                        try:
+                            self._results.put(item, timeout=0.1)
+                            break
+                        except queue.Full:
+                            continue
+        finally:
+            results.close()
+            Resolvers.reverse_resolver.save()
+            self._scan_finished.set()
+
+    def _discovered(self, item:dict):
+        '''
+        Returns a scan result as an entry for the list, named with connection_name(), or None if it is
+        this PC or already a known connection.
+        '''
+        if item['ip'] == self._this_pc['ip'] or self._is_known(item):
+            return None
+        item['hostname'] = item['name']
+        item['name'] = self.connection_name(item['name'] or item['ip'], item['port'])
+        return item
 
+    def _show_cached(self):
+        '''
+        Lists the servers which were alive in earlier scans.
+        '''
+        for result in SelectorTools.get_scan_cache().alive():
+            item = self._discovered({**result, 'alive': True})
+            if item is not None:
+                self._list_result(item)
+
+    def _list_result(self, item:dict):
+        '''
+        Adds a live scan result to the list, renames it if it is listed under another name, or removes it if it has gone.
+        '''
+        key = (item['ip'], item['port'])
+        i = self._discovered_index.get(key)
+        if i is not None:
+            self._listbox.delete(i)
+            if item['alive']:
+                self._connections_discovered[i] = item
+                self._listbox.insert(i, item['name'])
+            else:
+                # Servers going is rare, so re-indexing the entries after it is cheap overall.
+                del self._connections_discovered[i]
+                del self._discovered_index[key]
+                for j in range(i, len(self._connections_discovered)):
+                    listed = self._connections_discovered[j]
+                    self._discovered_index[(listed['ip'], listed['port'])] = j
+        elif item['alive']:
+            self._discovered_index[key] = len(self._connections_discovered)
+            self._connections_discovered.append(item)
+            self._listbox.insert(tk.END, item['name'])
+
+    def _is_known(self, item:dict):
+        '''
+        Returns True if a known connection already points at the scan result's address or hostname, and port.
+        '''
+        names = self._known_connections.find_by_ip(item['ip'])
+        if item['name'] != '':
+            names |= self._known_connections.find_by_hostname(item['name'])
+        for name in names:
+            connection = self._known_connections.get(name)
+            if connection is not None and str(connection['vnc port']) == str(item['port']):
+                return True
+        return False
+
+    @staticmethod
+    def connection_name(host:str, port:int):
+        '''
+        Returns the name for a discovered connection: the host for port 5900, host:N for display N on
+        port 5900+N, otherwise host::port.
+        '''
+        if port == 5900:
+            return host
+        display = SelectorTools.display_number(port)
+        if port > 5900 and display is not None:
+            return f'{host}:{display}'
+        return f'{host}::{port}'
+
+    @Tracing.traced('drain scan results', 'ui')
+    def _drain_results(self):
+        '''
+        Moves queued results into the listbox and updates the progress, until the scan thread finishes.
+        '''
+        self._drain_job = None
+        finished = self._scan_finished.is_set()
+        for _ in range(self.DRAIN_BATCH):
+            try:
+                item = self._results.get_nowait()
+            except queue.Empty:
+                break
+            self._list_result(item)
+        self.update_btn_state()
+        self._progress_bar['value'] = self._progress_bar['maximum'] * self._scanned / self._total
+        self._progress_text.set(self._last_scanned)
+        if finished and self._results.empty():
+            self._scan_thread = None
+            self._scan_button.config(text='Start Scan', state='normal')
+            if not self._stop_scan.is_set():
+                # Skipped addresses aren't counted in _scanned.
+                self._progress_bar['value'] = self._progress_bar['maximum']
+            summary = '{new} new, {gone} gone, {renamed} renamed'.format(**self._changes)
+            self._progress_text.set(f'Scan stopped: {summary}' if self._stop_scan.is_set() else summary)
         else:
-            messagebox.showerror('Scan Error', 'Start value must be less than end value, and both values must be between 1 and 255')
-        
-        self._scan_button.config(state='normal')
+            self._drain_job = self.after(self.DRAIN_INTERVAL, self._drain_results)
+
+    def destroy(self):
+        self._stop_scan.set()
+        if self._drain_job is not None:
+            self.after_cancel(self._drain_job)
+            self._drain_job = None
+        tk.Toplevel.destroy(self)
 
     def update_btn_state(self, event=None):
         if len(self._listbox.curselection()) > 0:
@@ -415,20 +874,20 @@ class ScanNetwork(tk.Toplevel):
             self._add_button.config(state='disabled')
 
     def add(self):
-        conns_to_add = []
-        for conn in self._connections_discovered:
-            if conn['name'] in [self._listbox.get(i) for i in self._listbox.curselection()]:
-                conns_to_add.append(conn)
-
-        available_connections = SelectorTools.get_connections_from_file()
-        for connection in conns_to_add:
-            available_connections[connection['name']] = {
-                'hostname': connection['name'], 
-                'ip address': connection['ip'], 
-                'vnc password': '', 
-                'vnc port': connection['port'],
-                'is alive': False}
-        SelectorTools.save_connections_to_file(available_connections)
+        conns_to_add = [self._connections_discovered[i] for i in self._listbox.curselection()]
+
+        new_connections = [(connection['name'], {
+            'hostname': connection['hostname'],
+            'ip address': connection['ip'], 
+            'vnc password': '', 
+            'vnc port': connection['port'],
+            'is alive': False}) for connection in conns_to_add]
+        # The known connections may have changed since the scan, e.g. in another instance, so duplicates are
+        # skipped as they are added rather than checked for beforehand.
+        skipped = []
+        self._known_connections.insert_new(new_connections, lambda name, connection, reason: skipped.append(f'{name}: duplicate {reason}'))
+        if skipped:
+            messagebox.showinfo('Add Connections', f'Skipped {len(skipped)} connection(s) which are already known:\n' + '\n'.join(skipped[:10]), parent=self)
         self.destroy()
 
 class ShowSettings(tk.Toplevel):
@@ -448,8 +907,18 @@ class ShowSettings(tk.Toplevel):
         settings = SelectorTools.get_settings_from_file()
         self.enable_scan = tk.IntVar()
         self.enable_close = tk.IntVar()
+        self.status_workers = tk.StringVar()
+        self.status_freshness = tk.StringVar()
+        self.rfb_handshake = tk.IntVar()
+        self.scan_cache_minutes = tk.StringVar()
+        self.viewer_path = tk.StringVar()
         self.enable_scan.set(settings['enable scan'])
         self.enable_close.set(settings['enable close'])
+        self.status_workers.set(str(settings['status workers']))
+        self.status_freshness.set(str(settings['status freshness']))
+        self.rfb_handshake.set(settings['rfb handshake'])
+        self.scan_cache_minutes.set(str(settings['scan cache minutes']))
+        self.viewer_path.set(settings['viewer path'])
 
         self.grab_set()
         self.create_widgets()
@@ -460,25 +929,79 @@ class ShowSettings(tk.Toplevel):
         root_frame.pack(fill=tk.BOTH, padx=2, pady=2)
         scan_frame = tk.LabelFrame(root_frame, text='Refresh known server status', font='Helvetica 9 bold')
         scan_frame.pack(fill=tk.BOTH, side=tk.TOP, anchor=tk.NW, padx=2, pady=2, ipadx=2, ipady=2)
+        network_frame = tk.LabelFrame(root_frame, text='Scan network', font='Helvetica 9 bold')
+        network_frame.pack(fill=tk.BOTH, side=tk.TOP, anchor=tk.NW, padx=2, pady=2, ipadx=2, ipady=2)
         close_frame = tk.LabelFrame(root_frame, text='Close app after connecting', font='Helvetica 9 bold')
         close_frame.pack(fill=tk.BOTH, side=tk.TOP, anchor=tk.NW, padx=2, pady=2, ipadx=2, ipady=2)
+        viewer_frame = tk.LabelFrame(root_frame, text='Viewer', font='Helvetica 9 bold')
+        viewer_frame.pack(fill=tk.BOTH, side=tk.TOP, anchor=tk.NW, padx=2, pady=2, ipadx=2, ipady=2)
         button_frame = tk.Frame(root_frame)
         button_frame.pack(padx=2, pady=2, ipadx=2, ipady=2)
 
         # Build and pack the scan frame widgets.
         tk.Checkbutton(scan_frame, variable=self.enable_scan, wraplength=400, text='If enabled, will scan the network and update the availability status of all known connections at a regular interval.').pack(anchor=tk.NW)
+        workers_subframe = tk.Frame(scan_frame)
+        workers_subframe.pack(anchor=tk.NW)
+        tk.Label(workers_subframe, text='Connections checked at once').pack(side=tk.LEFT, anchor=tk.NW)
+        tk.Entry(workers_subframe, textvariable=self.status_workers, width=5).pack(side=tk.LEFT, anchor=tk.NW)
+        freshness_subframe = tk.Frame(scan_frame)
+        freshness_subframe.pack(anchor=tk.NW)
+        tk.Label(freshness_subframe, text='Check a selected connection if its status is older than').pack(side=tk.LEFT, anchor=tk.NW)
+        tk.Entry(freshness_subframe, textvariable=self.status_freshness, width=5).pack(side=tk.LEFT, anchor=tk.NW)
+        tk.Label(freshness_subframe, text='seconds').pack(side=tk.LEFT, anchor=tk.NW)
+        tk.Checkbutton(scan_frame, variable=self.rfb_handshake, wraplength=400, text='If enabled, a server is only shown as available if it answers with a VNC handshake, rather than any open connection.').pack(anchor=tk.NW)
+
+        # Build and pack the network frame widgets.
+        cache_subframe = tk.Frame(network_frame)
+        cache_subframe.pack(anchor=tk.NW)
+        tk.Label(cache_subframe, text='Skip addresses found empty in the last').pack(side=tk.LEFT, anchor=tk.NW)
+        tk.Entry(cache_subframe, textvariable=self.scan_cache_minutes, width=5).pack(side=tk.LEFT, anchor=tk.NW)
+        tk.Label(cache_subframe, text='minutes').pack(side=tk.LEFT, anchor=tk.NW)
 
         # Build and pack the close frame widgets.
         tk.Checkbutton(close_frame, variable=self.enable_close, wraplength=400, text='If enabled, will close the app when a connection is started.').pack(anchor=tk.NW)
 
+        # Build and pack the viewer frame widgets.
+        tk.Label(viewer_frame, text='Viewer executable').pack(anchor=tk.NW)
+        viewer_entry = tk.Entry(viewer_frame, textvariable=self.viewer_path, width=60)
+        viewer_entry.pack(anchor=tk.NW)
+        Tooltip(viewer_entry, f'Leave empty for {SelectorTools.VIEWER_PATH}')
+
         # Build and pack the button frame widgets.
         tk.Button(button_frame, text='Save', width=10, command=self.save).pack(side=tk.LEFT)
         tk.Button(button_frame, text='Cancel', width=10, command=self.destroy).pack(side=tk.RIGHT)
 
     def save(self):
-        data = {
+        try:
+            status_workers = int(self.status_workers.get())
+            if status_workers < 1:
+                raise ValueError
+        except ValueError:
+            messagebox.showerror('Settings Error', 'Connections checked at once must be a whole number greater than 0.')
+            return
+        try:
+            status_freshness = float(self.status_freshness.get())
+            if status_freshness < 0:
+                raise ValueError
+        except ValueError:
+            messagebox.showerror('Settings Error', 'Selected connection status age must be a number of 0 or more.')
+            return
+        try:
+            scan_cache_minutes = float(self.scan_cache_minutes.get())
+            if scan_cache_minutes < 0:
+                raise ValueError
+        except ValueError:
+            messagebox.showerror('Settings Error', 'Minutes to skip empty addresses must be a number of 0 or more.')
+            return
+        data = SelectorTools.get_settings_from_file()
+        data.update({
             'enable scan': self.enable_scan.get(),
-            'enable close': self.enable_close.get()
-        }
+            'enable close': self.enable_close.get(),
+            'status workers': status_workers,
+            'status freshness': status_freshness,
+            'rfb handshake': self.rfb_handshake.get(),
+            'scan cache minutes': scan_cache_minutes,
+            'viewer path': self.viewer_path.get().strip()
+        })
         SelectorTools.save_settings_to_file(data)
         self.destroy()
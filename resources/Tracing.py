@@ -0,0 +1,171 @@
+'''
+Opt-in tracing for the VNC selector. Records spans for scans, probes, name lookups, connection file
+I/O and main window updates, and writes them as a Chrome trace file which can be opened in
+chrome://tracing or https://ui.perfetto.dev.
+
+Tracing is disabled by default. While disabled, instrumented code only checks the module level
+'enabled' flag, so the cost is close to zero.
+'''
+
+import os
+import json
+import time
+import atexit
+import threading
+import functools
+
+MAX_EVENTS = 1000000
+
+enabled = False
+file = None  # The trace file written by save(), assigned in start().
+dropped = 0  # Number of events not recorded because MAX_EVENTS was reached.
+_events = []
+_thread_names = {}  # Thread id -> thread name.
+_lock = threading.Lock()
+_pid = os.getpid()
+_origin = time.perf_counter()
+
+
+def now():
+    '''
+    Returns the current time in trace microseconds. Pass the result to complete() as the span's start.
+    '''
+    return (time.perf_counter() - _origin) * 1e6
+
+def _record(event:dict):
+    global dropped
+    thread = threading.current_thread()
+    event['pid'] = _pid
+    event['tid'] = thread.ident
+    with _lock:
+        if len(_events) >= MAX_EVENTS:
+            dropped += 1
+            return
+        _events.append(event)
+        _thread_names.setdefault(thread.ident, thread.name)
+
+def complete(name:str, category:str, start:float, args:dict=None):
+    '''
+    Records a span on the current thread which started at start (a now() value) and ends now.
+
+    args:
+      name (str):  The span name.
+      category (str):  The span category, e.g. 'scan', 'dns', 'storage' or 'ui'.
+      start (float):  The now() value when the span started.
+      args (dict):  Extra values shown with the span. (default None)
+    '''
+    _record({'name': name, 'cat': category, 'ph': 'X', 'ts': start, 'dur': now() - start, 'args': args or {}})
+
+def overlapping(name:str, category:str, id, start:float, args:dict=None):
+    '''
+    Records a span which may overlap others on the same thread (e.g. one of many probes run from a
+    single selector loop) as an async span, shown on its own track. Ends now.
+
+    args:
+      name (str):  The span name.
+      category (str):  The span category.
+      id (hashable):  Identifies the span, unique among spans in flight at the same time.
+      start (float):  The now() value when the span started.
+      args (dict):  Extra values shown with the span. (default None)
+    '''
+    id = str(id)
+    _record({'name': name, 'cat': category, 'ph': 'b', 'id': id, 'ts': start, 'args': args or {}})
+    _record({'name': name, 'cat': category, 'ph': 'e', 'id': id, 'ts': now()})
+
+
+class _Span(object):
+    __slots__ = ('name', 'category', 'args', 'start')
+
+    def __init__(self, name, category, args):
+        self.name = name
+        self.category = category
+        self.args = args
+
+    def __enter__(self):
+        self.start = now()
+        return self
+
+    def __exit__(self, *exc):
+        complete(self.name, self.category, self.start, self.args)
+        return False
+
+
+class _NullSpan(object):
+    args = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NULL_SPAN = _NullSpan()
+
+
+def span(name:str, category:str, **args):
+    '''
+    Returns a context manager which records a span around its block, while tracing is enabled.
+    Values added to its args dict are shown with the span.
+
+    args:
+      name (str):  The span name.
+      category (str):  The span category.
+      **args:  Extra values shown with the span.
+    '''
+    if not enabled:
+        return _NULL_SPAN
+    return _Span(name, category, args)
+
+def traced(name:str, category:str):
+    '''
+    Decorator which records a span for each call, while tracing is enabled.
+    '''
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return function(*args, **kwargs)
+            start = now()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                complete(name, category, start)
+        return wrapper
+    return decorator
+
+def start(trace_file:str):
+    '''
+    Enables tracing. The trace is written to trace_file when the program exits, or when save() is called.
+
+    args:
+      trace_file (str):  The trace file path and name, usually ending in .json.
+    '''
+    global enabled, file
+    if file is None:
+        atexit.register(save)
+    file = trace_file
+    enabled = True
+
+def save():
+    '''
+    Writes every span recorded so far to the trace file, replacing it atomically.
+    '''
+    if file is None:
+        return
+    with _lock:
+        events = list(_events)
+        names = dict(_thread_names)
+        dropped_events = dropped
+    events += [{'name': 'thread_name', 'ph': 'M', 'pid': _pid, 'tid': tid, 'args': {'name': name}} for tid, name in names.items()]
+    temp = f'{file}.tmp'
+    with open(temp, 'w') as f:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms', 'otherData': {'dropped events': dropped_events}}, f)
+    os.replace(temp, file)
+
+def configure_from_environment():
+    '''
+    Starts tracing to the file named by the VNC_SELECTOR_TRACE environment variable, if it is set.
+    '''
+    trace_file = os.environ.get('VNC_SELECTOR_TRACE')
+    if trace_file:
+        start(trace_file)
@@ -0,0 +1,86 @@
+'''
+Tests for the neighbor (ARP) table parsers and scan ordering, using fixture text instead of a real LAN.
+'''
+
+import os
+import tempfile
+import unittest
+import resources.SelectorTools as SelectorTools
+
+PROC_NET_ARP = '''IP address       HW type     Flags       HW address            Mask     Device
+192.168.1.1      0x1         0x2         aa:bb:cc:dd:ee:01     *        eth0
+192.168.1.20     0x1         0x6         aa:bb:cc:dd:ee:14     *        eth0
+192.168.1.30     0x1         0x0         00:00:00:00:00:00     *        eth0
+192.168.1.40     0x1         0x2         00:00:00:00:00:00     *        eth0
+192.168.1.50     0x1         zz          aa:bb:cc:dd:ee:32     *        eth0
+not-an-address   0x1         0x2         aa:bb:cc:dd:ee:33     *        eth0
+192.168.1.60     0x1
+'''
+
+IP_NEIGH = '''192.168.1.1 dev eth0 lladdr aa:bb:cc:dd:ee:01 REACHABLE
+192.168.1.20 dev eth0 lladdr aa:bb:cc:dd:ee:14 STALE
+192.168.1.30 dev eth0  FAILED
+192.168.1.40 dev eth0 lladdr aa:bb:cc:dd:ee:28 INCOMPLETE
+fe80::1 dev eth0 lladdr aa:bb:cc:dd:ee:01 router REACHABLE
+'''
+
+ARP_A = '''
+Interface: 192.168.1.10 --- 0x4
+  Internet Address      Physical Address      Type
+  192.168.1.1           aa-bb-cc-dd-ee-01     dynamic
+  192.168.1.20          aa-bb-cc-dd-ee-14     static
+  192.168.1.255         ff-ff-ff-ff-ff-ff     static
+  224.0.0.22            01-00-5e-00-00-16     static
+  192.168.1.99          aa-bb-cc-dd-ee-63     invalid
+'''
+
+
+class ParserTests(unittest.TestCase):
+    def test_parse_proc_arp(self):
+        self.assertEqual(SelectorTools.parse_proc_arp(PROC_NET_ARP), {'192.168.1.1', '192.168.1.20'})
+
+    def test_parse_ip_neigh(self):
+        self.assertEqual(SelectorTools.parse_ip_neigh(IP_NEIGH), {'192.168.1.1', '192.168.1.20'})
+
+    def test_parse_arp_a(self):
+        self.assertEqual(SelectorTools.parse_arp_a(ARP_A), {'192.168.1.1', '192.168.1.20'})
+
+    def test_empty_tables(self):
+        self.assertEqual(SelectorTools.parse_proc_arp(''), set())
+        self.assertEqual(SelectorTools.parse_ip_neigh(''), set())
+        self.assertEqual(SelectorTools.parse_arp_a(''), set())
+
+
+class OrderTests(unittest.TestCase):
+    def setUp(self):
+        self.ranges = SelectorTools.parse_targets('192.168.1.1-192.168.1.6')
+        # 10.0.0.1 is outside the ranges and must not be yielded.
+        self.table = SelectorTools.parse_proc_arp(PROC_NET_ARP) | {'192.168.1.5', '10.0.0.1'}
+
+    def test_first(self):
+        order = list(SelectorTools.order_by_neighbors(self.ranges, 'first', neighbor_table=self.table))
+        self.assertEqual(order, ['192.168.1.1', '192.168.1.5', '192.168.1.2', '192.168.1.3', '192.168.1.4', '192.168.1.6'])
+
+    def test_first_shuffled_keeps_every_address_once(self):
+        order = list(SelectorTools.order_by_neighbors(self.ranges, 'first', shuffle=True, neighbor_table=self.table))
+        self.assertEqual(order[:2], ['192.168.1.1', '192.168.1.5'])
+        self.assertEqual(sorted(order), sorted(SelectorTools.expand_targets(self.ranges)))
+
+    def test_only(self):
+        order = list(SelectorTools.order_by_neighbors(self.ranges, 'only', neighbor_table=self.table))
+        self.assertEqual(order, ['192.168.1.1', '192.168.1.5'])
+
+    def test_invalid_mode(self):
+        with self.assertRaises(ValueError):
+            list(SelectorTools.order_by_neighbors(self.ranges, 'last', neighbor_table=self.table))
+
+    def test_read_neighbor_table_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            file = os.path.join(directory, 'arp')
+            with open(file, 'w') as f:
+                f.write(PROC_NET_ARP)
+            self.assertEqual(SelectorTools.read_neighbor_table(file), {'192.168.1.1', '192.168.1.20'})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+'''
+Tests for the probe timeouts derived by RttEstimator.
+'''
+
+import unittest
+import resources.SelectorTools as SelectorTools
+
+
+class RttEstimatorTests(unittest.TestCase):
+    def setUp(self):
+        self.estimator = SelectorTools.RttEstimator(first_timeout=0.25, min_timeout=0.05, max_timeout=3.0)
+
+    def test_unknown_address_uses_first_timeout(self):
+        self.assertEqual(self.estimator.timeout('10.0.0.1'), 0.25)
+        self.assertFalse(self.estimator.measured('10.0.0.1'))
+
+    def test_scan_timeouts_never_back_off(self):
+        for _ in range(3):
+            self.estimator.timed_out('10.0.0.1')
+        self.assertEqual(self.estimator.timeout('10.0.0.1'), 0.25)
+
+    def test_dropping_host_is_escalated_once(self):
+        self.estimator.timed_out('10.0.0.1', escalate=True)
+        self.assertEqual(self.estimator.timeout('10.0.0.1'), 3.0)
+        # The probe at max_timeout times out too, so the host goes back to first_timeout...
+        self.estimator.timed_out('10.0.0.1', escalate=True)
+        self.assertEqual(self.estimator.timeout('10.0.0.1'), 0.25)
+        # ...and isn't escalated again within escalate_interval.
+        self.estimator.timed_out('10.0.0.1', escalate=True)
+        self.assertEqual(self.estimator.timeout('10.0.0.1'), 0.25)
+
+    def test_dropping_host_is_escalated_again_after_interval(self):
+        self.estimator.escalate_interval = 0
+        self.estimator.timed_out('10.0.0.1', escalate=True)
+        self.estimator.timed_out('10.0.0.1', escalate=True)
+        self.estimator.timed_out('10.0.0.1', escalate=True)
+        self.assertEqual(self.estimator.timeout('10.0.0.1'), 3.0)
+
+    def test_slow_host_is_measured_after_escalation(self):
+        self.estimator.timed_out('10.0.0.1', escalate=True)
+        self.estimator.sample('10.0.0.1', 0.4)
+        self.assertTrue(self.estimator.measured('10.0.0.1'))
+        self.assertAlmostEqual(self.estimator.timeout('10.0.0.1'), 0.4 + 4 * 0.2)
+
+    def test_measured_host_backs_off_until_it_answers(self):
+        self.estimator.sample('10.0.0.1', 0.1)
+        first = self.estimator.timeout('10.0.0.1')
+        self.estimator.timed_out('10.0.0.1')
+        self.assertAlmostEqual(self.estimator.timeout('10.0.0.1'), first * 2)
+        self.estimator.sample('10.0.0.1', 0.1)
+        self.assertLess(self.estimator.timeout('10.0.0.1'), first * 2)
+
+
+if __name__ == '__main__':
+    unittest.main()